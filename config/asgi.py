@@ -13,4 +13,15 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Модели доступны только после инициализации Django
+from documents.progress import PATH_RE, progress_stream  # noqa: E402
+
+
+async def application(scope, receive, send):
+    # Поток хода обработки документа (SSE) обслуживается напрямую, остальные запросы — Django
+    if scope['type'] == 'http' and PATH_RE.fullmatch(scope['path']):
+        await progress_stream(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
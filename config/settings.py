@@ -18,6 +18,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     # Third-party
     'django_celery_beat',
     # Local
@@ -86,6 +87,9 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
     'staticfiles': {
         'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage',
     },
@@ -98,6 +102,32 @@ CELERY_RESULT_BACKEND = 'redis://redis:6379/1'
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_TASK_TRACK_STARTED = True
+CELERY_TASK_TIME_LIMIT = 30 * 60
+CELERY_RESULT_EXPIRES = 3600
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+# Очереди по характеру нагрузки: cpu — разбор PDF (воркер prefork, процессов по числу ядер),
+# io — задачи, которые в основном ждут OCR/LLM API и диск (воркер с пулом потоков, десятки задач
+# на процесс). Каждая очередь обслуживается своим воркером и масштабируется отдельно.
+CELERY_TASK_DEFAULT_QUEUE = 'cpu'
+CELERY_TASK_ROUTES = {
+    f'documents.tasks.{name}': {'queue': 'io'}
+    for name in (
+        'finalize_upload_task',
+        'run_ocr_for_document',
+        'run_ocr_for_pages',
+        'run_ocr_for_page',
+        'classify_document_pages',
+        'extract_materials_from_document',
+        'pipeline_stage_done',
+        'pipeline_ocr_done',
+        'pipeline_failed',
+        'pipeline_ocr_task',
+        'pipeline_classify_task',
+        'pipeline_materials_task',
+    )
+}
 
 CACHES = {
     'default': {
@@ -1,7 +1,10 @@
 from django.contrib import admin
 from django.urls import path, include
 
+from documents.api.views import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('documents/api/', include('documents.api.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
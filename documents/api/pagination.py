@@ -0,0 +1,23 @@
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+
+
+class DocumentCursorPagination(CursorPagination):
+    """Курсорная пагинация: стоимость запроса не зависит от номера страницы выдачи"""
+    ordering = '-id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class SearchResultPagination(LimitOffsetPagination):
+    """Выдача поиска упорядочена по релевантности, поэтому пагинация по смещению"""
+    default_limit = 20
+    max_limit = 100
+
+
+class IdCursorPagination(CursorPagination):
+    """Курсорная пагинация по id для больших выборок блоков и материалов"""
+    ordering = 'id'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
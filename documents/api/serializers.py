@@ -1,5 +1,7 @@
 from rest_framework import serializers
-from documents.models import Document, Page
+from documents.conf import UPLOAD_CHUNK_SIZE, UPLOAD_MAX_SIZE
+from documents.models import Document, Material, Page, TextBlock, UploadSession
+from documents.uploads import missing_chunks
 
 
 class DocumentUploadSerializer(serializers.ModelSerializer):
@@ -8,6 +10,23 @@ class DocumentUploadSerializer(serializers.ModelSerializer):
         fields = ['id', 'file', 'original_filename']
 
 
+class UploadSessionSerializer(serializers.ModelSerializer):
+    chunk_size = serializers.IntegerField(min_value=64 * 1024, max_value=64 * 1024 * 1024, default=UPLOAD_CHUNK_SIZE)
+    total_size = serializers.IntegerField(min_value=1, max_value=UPLOAD_MAX_SIZE)
+    chunk_count = serializers.IntegerField(read_only=True)
+    missing_chunks = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'original_filename', 'total_size', 'chunk_size', 'chunk_count', 'missing_chunks', 'status',
+                  'error', 'document', 'created_at']
+        read_only_fields = ['status', 'error', 'document', 'created_at']
+
+    def get_missing_chunks(self, session) -> list[int]:
+        """Номера еще не полученных частей — для возобновления загрузки"""
+        return missing_chunks(session)
+
+
 class PageSerializer(serializers.ModelSerializer):
     class Meta:
         model = Page
@@ -20,4 +39,63 @@ class DocumentSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Document
-        fields = ['id', 'original_filename', 'uploaded_at', 'file', 'pages']
+        fields = ['id', 'original_filename', 'uploaded_at', 'file', 'page_count', 'pipeline_status', 'pages']
+
+
+class PageSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Page
+        fields = ['id', 'number', 'is_scanned', 'classification', 'width', 'height']
+
+
+class DynamicFieldsMixin:
+    """Ограничение набора полей: serializer(..., fields=['id', 'original_filename'])"""
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class DocumentListSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    """Краткое представление документа для списка; страницы — только по expand=pages или expand=pages.text"""
+
+    class Meta:
+        model = Document
+        fields = ['id', 'original_filename', 'uploaded_at', 'file', 'page_count']
+
+    def __init__(self, *args, expand=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        if 'pages.text' in expand:
+            self.fields['pages'] = PageSerializer(many=True, read_only=True)
+        elif 'pages' in expand:
+            self.fields['pages'] = PageSummarySerializer(many=True, read_only=True)
+
+
+class PageSearchResultSerializer(serializers.ModelSerializer):
+    document_filename = serializers.CharField(source='document.original_filename', read_only=True)
+    rank = serializers.FloatField(read_only=True)
+    snippet = serializers.CharField(read_only=True)
+
+    class Meta:
+        model = Page
+        fields = ['id', 'document', 'document_filename', 'number', 'classification', 'rank', 'snippet']
+
+
+class TextBlockRegionSerializer(serializers.ModelSerializer):
+    document = serializers.IntegerField(source='page.document_id', read_only=True)
+    page_number = serializers.IntegerField(source='page.number', read_only=True)
+
+    class Meta:
+        model = TextBlock
+        fields = ['id', 'document', 'page', 'page_number', 'x0', 'y0', 'x1', 'y1', 'text']
+
+
+class MaterialSerializer(serializers.ModelSerializer):
+    document = serializers.IntegerField(source='page.document_id', read_only=True)
+    page_number = serializers.IntegerField(source='page.number', read_only=True)
+
+    class Meta:
+        model = Material
+        fields = ['id', 'name', 'characteristics', 'document', 'page', 'page_number']
@@ -1,11 +1,13 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from documents.api.views import DocumentViewSet
+from documents.api.views import DocumentViewSet, MaterialViewSet, UploadSessionViewSet
 
 app_name = 'api'
 
 router = DefaultRouter()
 router.register(r'documents', DocumentViewSet, basename='document')
+router.register(r'materials', MaterialViewSet, basename='material')
+router.register(r'uploads', UploadSessionViewSet, basename='upload')
 
 urlpatterns = [
     path('', include(router.urls)),
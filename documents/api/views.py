@@ -1,23 +1,75 @@
-from rest_framework import status, viewsets
+import json
+
+from django.db import IntegrityError
+from django.db.models import Prefetch
+from django.http import HttpResponse, StreamingHttpResponse
+from rest_framework import mixins, status, viewsets
+from rest_framework.exceptions import ValidationError
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser
-from documents.models import Document
+from documents import metrics
+from documents.models import Document, Material, Page, UploadSession
 from documents.tasks import (
-    parse_pdf_task, run_ocr_for_document, classify_document_pages, extract_materials_from_document)
-from documents.api.serializers import DocumentUploadSerializer, DocumentSerializer
+    finalize_upload_task, parse_pdf_task, run_ocr_for_document, classify_document_pages,
+    extract_materials_from_document, start_pipeline)
+from documents.api.pagination import IdCursorPagination, DocumentCursorPagination, SearchResultPagination
+from documents.api.serializers import (
+    DocumentListSerializer, DocumentUploadSerializer, DocumentSerializer, MaterialSerializer,
+    PageSearchResultSerializer, PageSerializer, PageSummarySerializer, TextBlockRegionSerializer,
+    UploadSessionSerializer)
+from documents.export import iter_document_ndjson
+from documents.regions import REGION_OPERATORS, find_blocks_in_region
+from documents.pipeline import is_pipeline_running
+from documents.search import search_pages
+from documents.uploads import missing_chunks, save_chunk
+from documents.utils import compute_content_hash
 
 
 class DocumentViewSet(viewsets.ModelViewSet):
     queryset = Document.objects.all()
     serializer_class = DocumentSerializer
     parser_classes = [MultiPartParser]
+    pagination_class = DocumentCursorPagination
+
+    def _query_list(self, name: str) -> list[str]:
+        value = self.request.query_params.get(name, '')
+        return [item.strip() for item in value.split(',') if item.strip()]
+
+    def _query_int(self, name: str):
+        value = self.request.query_params.get(name)
+        return int(value) if value else None
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            # Только колонки краткого представления; тексты страниц — только если их запросили
+            expand = self._query_list('expand')
+            queryset = queryset.only(*DocumentListSerializer.Meta.fields)
+            if 'pages.text' in expand:
+                page_fields = PageSerializer.Meta.fields
+            elif 'pages' in expand:
+                page_fields = PageSummarySerializer.Meta.fields
+            else:
+                return queryset
+            pages = Page.objects.only('document_id', *page_fields).order_by('number')
+            return queryset.prefetch_related(Prefetch('pages', queryset=pages))
+        if self.action == 'retrieve':
+            return queryset.prefetch_related(Prefetch('pages', queryset=Page.objects.order_by('number')))
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        if self.action == 'list':
+            kwargs.setdefault('context', self.get_serializer_context())
+            return DocumentListSerializer(
+                *args, fields=self._query_list('fields'), expand=self._query_list('expand'), **kwargs)
+        return super().get_serializer(*args, **kwargs)
 
     @action(detail=False, methods=['post'], url_path='upload')
     def upload(self, request):
         serializer = DocumentUploadSerializer(data=request.data)
         if serializer.is_valid():
-            document = serializer.save()
+            document = serializer.save(content_hash=compute_content_hash(serializer.validated_data['file']))
             document.original_filename = document.file.name
             document.save()
             parse_pdf_task.delay(document.id)
@@ -39,6 +91,86 @@ class DocumentViewSet(viewsets.ModelViewSet):
             "scanned_percentage": round((scanned / total) * 100, 2) if total else 0
         })
 
+    @action(detail=False, methods=['get'], url_path='search')
+    def search(self, request):
+        """Полнотекстовый поиск по страницам (?q=, необязательно &document=) с ранжированием и сниппетами"""
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'detail': 'Не задан поисковый запрос q'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            document_id = self._query_int('document')
+        except ValueError:
+            return Response({'detail': 'document должен быть целым числом'}, status=status.HTTP_400_BAD_REQUEST)
+
+        paginator = SearchResultPagination()
+        results = paginator.paginate_queryset(search_pages(query, document_id), request, view=self)
+        return paginator.get_paginated_response(PageSearchResultSerializer(results, many=True).data)
+
+    def _region_response(self, request, document_id=None):
+        """Блоки в прямоугольнике ?x0=&y0=&x1=&y1= (&relative=1 — доли страницы, &mode=intersects|within)"""
+        try:
+            rect = tuple(float(request.query_params[name]) for name in ('x0', 'y0', 'x1', 'y1'))
+        except (KeyError, ValueError):
+            return Response({'detail': 'x0, y0, x1, y1 обязательны и должны быть числами'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        mode = request.query_params.get('mode', 'intersects')
+        if mode not in REGION_OPERATORS:
+            return Response({'detail': f'mode: одно из {", ".join(REGION_OPERATORS)}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        relative = request.query_params.get('relative') in ('1', 'true')
+
+        blocks = find_blocks_in_region(rect, relative, mode, document_id)
+        blocks = blocks.select_related('page').only(
+            'id', 'x0', 'y0', 'x1', 'y1', 'text', 'page__id', 'page__number', 'page__document_id')
+        paginator = IdCursorPagination()
+        results = paginator.paginate_queryset(blocks, request, view=self)
+        return paginator.get_paginated_response(TextBlockRegionSerializer(results, many=True).data)
+
+    @action(detail=False, methods=['get'], url_path='region')
+    def corpus_region(self, request):
+        """Текстовые блоки в области страницы по всем документам"""
+        return self._region_response(request)
+
+    @action(detail=True, methods=['get'], url_path='region')
+    def region(self, request, pk=None):
+        """Текстовые блоки в области страницы одного документа"""
+        return self._region_response(request, self.get_object().id)
+
+    @action(detail=True, methods=['get'], url_path='export')
+    def export(self, request, pk=None):
+        """Потоковая выгрузка страниц и текстовых блоков в NDJSON (?page_from=&page_to=)"""
+        document = self.get_object()
+        try:
+            page_from = self._query_int('page_from')
+            page_to = self._query_int('page_to')
+        except ValueError:
+            return Response({'detail': 'page_from и page_to должны быть целыми числами'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(
+            iter_document_ndjson(document, page_from, page_to), content_type='application/x-ndjson')
+        response['Content-Disposition'] = f'attachment; filename="document-{document.id}.ndjson"'
+        return response
+
+    @action(detail=True, methods=['post'])
+    def run_pipeline(self, request, pk=None):
+        """Полная обработка: разбор -> OCR -> классификация и извлечение материалов
+
+        force=1 — перезапуск, даже если конвейер числится выполняемым (например, воркер погиб
+        до отметки ошибки и этапы остались в pending/running). Состояние этапов сбрасывается.
+        """
+        document = self.get_object()
+        force = request.query_params.get('force') in ('1', 'true')
+        if not force and is_pipeline_running(document):
+            return Response({'status': 'Pipeline already running', 'pipeline_status': document.pipeline_status},
+                            status=status.HTTP_409_CONFLICT)
+        start_pipeline(document.id)
+        return Response({'status': 'Pipeline started'}, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=['get'])
+    def pipeline(self, request, pk=None):
+        return Response(self.get_object().pipeline_status)
+
     @action(detail=True, methods=['post'])
     def run_ocr(self, request, pk=None):
         document = self.get_object()
@@ -56,3 +188,106 @@ class DocumentViewSet(viewsets.ModelViewSet):
         document = self.get_object()
         extract_materials_from_document.delay(document.id)
         return Response({'status': 'Materials extraction started'})
+
+
+class MaterialViewSet(viewsets.ReadOnlyModelViewSet):
+    """Материалы по всему корпусу с фильтрами по характеристикам
+
+    ?gost=5632-72, ?grade=12Х18Н10Т или ?characteristics={"Тип": "нержавеющая сталь"} — точное
+    совпадение значений, запрос идет по GIN-индексу characteristics (@>).
+    """
+    serializer_class = MaterialSerializer
+    pagination_class = IdCursorPagination
+
+    # Параметр запроса -> ключ в characteristics
+    CHARACTERISTIC_FILTERS = {'gost': 'ГОСТ', 'grade': 'Марка'}
+
+    def _characteristics_filter(self) -> dict:
+        params = self.request.query_params
+        if raw := params.get('characteristics'):
+            try:
+                characteristics = json.loads(raw)
+            except json.JSONDecodeError:
+                characteristics = None
+            if not isinstance(characteristics, dict):
+                raise ValidationError({'characteristics': 'Ожидается JSON-объект'})
+        else:
+            characteristics = {}
+        for param, key in self.CHARACTERISTIC_FILTERS.items():
+            if value := params.get(param):
+                characteristics[key] = value
+        return characteristics
+
+    def get_queryset(self):
+        queryset = Material.objects.select_related('page').only(
+            'id', 'name', 'characteristics', 'page__id', 'page__number', 'page__document_id')
+        if characteristics := self._characteristics_filter():
+            queryset = queryset.filter(characteristics__contains=characteristics)
+        return queryset
+
+    @action(detail=False, methods=['get'], url_path='documents')
+    def documents(self, request):
+        """Документы, в которых встречаются материалы с заданными характеристиками"""
+        characteristics = self._characteristics_filter()
+        if not characteristics:
+            return Response({'detail': 'Не задан ни один фильтр по характеристикам'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        document_ids = Material.objects.filter(characteristics__contains=characteristics).values('page__document_id')
+        documents = Document.objects.filter(id__in=document_ids).only(*DocumentListSerializer.Meta.fields)
+        paginator = DocumentCursorPagination()
+        results = paginator.paginate_queryset(documents, request, view=self)
+        return paginator.get_paginated_response(
+            DocumentListSerializer(results, many=True, context=self.get_serializer_context()).data)
+
+
+class UploadSessionViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """Загрузка больших PDF по частям
+
+    POST /uploads/ {"original_filename", "total_size", "chunk_size"} — создание сессии;
+    PUT /uploads/{id}/chunks/{index}/ — тело запроса как есть (application/octet-stream),
+    необязательный заголовок X-Chunk-SHA256 для проверки части;
+    GET /uploads/{id}/ — состояние и номера недостающих частей для возобновления;
+    POST /uploads/{id}/finalize/ — сборка файла и запуск разбора в фоне.
+    """
+    queryset = UploadSession.objects.all()
+    serializer_class = UploadSessionSerializer
+
+    @action(detail=True, methods=['put'], url_path=r'chunks/(?P<index>\d+)')
+    def chunk(self, request, pk=None, index=None):
+        session = self.get_object()
+        if session.status != UploadSession.STATUS_OPEN:
+            return Response({'detail': 'Загрузка уже завершена'}, status=status.HTTP_409_CONFLICT)
+        # Без тела запроса (Content-Length: 0) DRF не создает поток
+        if request.stream is None:
+            return Response({'detail': 'Пустое тело запроса'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            # Тело запроса читается потоком и пишется в хранилище по мере поступления
+            chunk = save_chunk(session, int(index), request.stream, request.headers.get('X-Chunk-SHA256', ''))
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except IntegrityError:
+            return Response({'detail': f'Часть {index} одновременно загружается другим запросом'},
+                            status=status.HTTP_409_CONFLICT)
+        return Response({'index': chunk.index, 'size': chunk.size, 'sha256': chunk.sha256})
+
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, pk=None):
+        session = self.get_object()
+        if session.status != UploadSession.STATUS_OPEN:
+            return Response(self.get_serializer(session).data, status=status.HTTP_409_CONFLICT)
+        if missing := missing_chunks(session):
+            return Response({'detail': 'Получены не все части', 'missing_chunks': missing},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # Смена статуса защищает от повторной сборки при параллельных запросах
+        updated = UploadSession.objects.filter(id=session.id, status=UploadSession.STATUS_OPEN).update(
+            status=UploadSession.STATUS_ASSEMBLING)
+        if updated:
+            finalize_upload_task.delay(str(session.id))
+        return Response({'id': session.id, 'status': UploadSession.STATUS_ASSEMBLING},
+                        status=status.HTTP_202_ACCEPTED)
+
+
+def metrics_view(request):
+    """Метрики всех процессов (gunicorn и Celery) в текстовом формате Prometheus"""
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
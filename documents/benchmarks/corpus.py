@@ -0,0 +1,70 @@
+import random
+
+from dataclasses import dataclass
+
+import fitz
+
+# Синтетические PDF для бенчмарков разбора: плотность текста, доля страниц-сканов
+# (полностраничное растровое изображение) и доля страниц с «шумом» распознавания
+# задаются параметрами, генерация детерминирована по seed.
+
+WORDS = (
+    'steel', 'pipe', 'flange', 'valve', 'certificate', 'conformity', 'grade', 'pressure', 'nominal', 'diameter',
+    'tensile', 'strength', 'yield', 'hardness', 'chemical', 'composition', 'carbon', 'chromium', 'nickel', 'test',
+    'batch', 'heat', 'number', 'drawing', 'sheet', 'revision', 'approved', 'inspection', 'weld', 'material',
+)
+
+# Типичные ошибки распознавания: путаница букв и цифр, удвоенные символы, мусорные знаки
+NOISE = ('l1', '0o', 'o0', '1i', 'rn', 'vv', ',,', '..', '|', '\\', '[', ']')
+
+
+@dataclass(frozen=True)
+class CorpusSpec:
+    pages: int = 50
+    lines_per_page: int = 40      # плотность текста
+    image_ratio: float = 0.0      # доля страниц-сканов с полностраничным изображением
+    noise_ratio: float = 0.0      # доля текстовых страниц с артефактами OCR
+    image_size: int = 800         # сторона растра скана в пикселях
+    seed: int = 0
+
+
+# Наборы, с которыми сравниваются базовые значения (baselines.json)
+CORPORA = {
+    'text': CorpusSpec(pages=50, lines_per_page=40),
+    'sparse': CorpusSpec(pages=50, lines_per_page=5),
+    'scanned': CorpusSpec(pages=30, image_ratio=1.0),
+    'mixed': CorpusSpec(pages=50, lines_per_page=30, image_ratio=0.3, noise_ratio=0.3),
+}
+
+
+def _line(rng: random.Random, noisy: bool) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(6, 12))]
+    if noisy:
+        for _ in range(rng.randint(1, 3)):
+            position = rng.randrange(len(words))
+            word = words[position]
+            cut = rng.randrange(len(word) + 1)
+            words[position] = word[:cut] + rng.choice(NOISE) + word[cut:]
+    return ' '.join(words) + f' {rng.randint(1, 9999)}'
+
+
+def _scan_pixmap(rng: random.Random, size: int) -> fitz.Pixmap:
+    """Серый растр с шумом: плохо сжимается, как настоящий скан"""
+    samples = bytes(rng.randrange(180, 256) for _ in range(size * size))
+    return fitz.Pixmap(fitz.csGRAY, size, size, samples, False)
+
+
+def generate_pdf(path: str, spec: CorpusSpec) -> str:
+    rng = random.Random(spec.seed)
+    pixmap = _scan_pixmap(rng, spec.image_size) if spec.image_ratio else None
+    with fitz.open() as pdf:
+        for _ in range(spec.pages):
+            page = pdf.new_page()
+            if pixmap is not None and rng.random() < spec.image_ratio:
+                page.insert_image(page.rect, pixmap=pixmap)
+                continue
+            noisy = rng.random() < spec.noise_ratio
+            text = '\n'.join(_line(rng, noisy) for _ in range(spec.lines_per_page))
+            page.insert_textbox(fitz.Rect(36, 36, page.rect.width - 36, page.rect.height - 36), text, fontsize=8)
+        pdf.save(path, garbage=3, deflate=True)
+    return path
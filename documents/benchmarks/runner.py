@@ -0,0 +1,176 @@
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass, field
+from typing import Callable
+from unittest import mock
+
+import fitz
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from documents import utils
+from documents.benchmarks.corpus import CorpusSpec, generate_pdf
+from documents.benchmarks.stub_server import StubServer
+from documents.features import PageFeatures
+from documents.models import Document
+
+# Замеры горячего пути разбора PDF на синтетическом корпусе: процессорное время на страницу,
+# пик памяти Python-кучи (tracemalloc; буферы MuPDF в него не входят), число SQL-запросов
+# и обращений к заглушке LLM/OCR на страницу (заглушка работает в том же процессе, и ее обработка
+# запросов входит в процессорное время). Изменения в БД откатываются после каждого прогона,
+# кэш LLM на время замеров — отдельный локальный, чтобы не было попаданий от прошлых запусков.
+
+BASELINES_PATH = os.path.join(os.path.dirname(__file__), 'baselines.json')
+
+# Метрики, по которым ищется регрессия (больше — хуже)
+COMPARED_METRICS = ('cpu_ms_per_page', 'peak_kb', 'queries_per_page', 'requests_per_page')
+
+
+# Подготовка замера получает путь к PDF и ExitStack для открытых ресурсов
+# и возвращает функцию, время работы которой измеряется
+
+def setup_is_scanned_page(path: str, stack: ExitStack) -> Callable:
+    pdf = stack.enter_context(fitz.open(path))
+    return lambda: [utils.is_scanned_page(page) for page in pdf]
+
+
+def setup_looks_like_ocr_artifacts(path: str, stack: ExitStack) -> Callable:
+    with fitz.open(path) as pdf:
+        texts = [page.get_text() for page in pdf]
+    return lambda: [utils.looks_like_ocr_artifacts(text) for text in texts]
+
+
+def setup_default_heuristic_check(path: str, stack: ExitStack) -> Callable:
+    pdf = stack.enter_context(fitz.open(path))
+    pages = [(page, PageFeatures.from_page(page)) for page in pdf]
+    return lambda: [utils.default_heuristic_check(page, features.raw_text, features) for page, features in pages]
+
+
+def setup_process_pdf(path: str, stack: ExitStack) -> Callable:
+    document = Document.objects.create(file=os.path.basename(path), original_filename='benchmark.pdf')
+    return lambda: utils.process_pdf(document)
+
+
+BENCHMARKS = {
+    'is_scanned_page': setup_is_scanned_page,
+    'looks_like_ocr_artifacts': setup_looks_like_ocr_artifacts,
+    'default_heuristic_check': setup_default_heuristic_check,
+    'process_pdf': setup_process_pdf,
+}
+
+
+@dataclass
+class Result:
+    benchmark: str
+    corpus: str
+    pages: int
+    metrics: dict = field(default_factory=dict)
+    regressions: list = field(default_factory=list)
+
+
+@contextmanager
+def stubbed_providers(latency: float = 0.0):
+    """Заглушка вместо LLM и OCR API и локальный кэш вместо общего"""
+    with StubServer(latency) as stub, ExitStack() as stack:
+        stack.enter_context(override_settings(
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bench'}},
+        ))
+        stack.enter_context(mock.patch('documents.utils.LLM_API_URL', f'{stub.url}/chat'))
+        stack.enter_context(mock.patch('documents.llm.LLM_API_URL', f'{stub.url}/llm'))
+        stack.enter_context(mock.patch('documents.ocr.MISTRAL_OCR_URL', f'{stub.url}/ocr'))
+        yield stub
+
+
+def _run_once(setup: Callable, path: str, stub: StubServer, trace_memory: bool) -> dict:
+    cache.clear()
+    with ExitStack() as stack, transaction.atomic():
+        run = setup(path, stack)
+        requests_before = stub.request_count
+        if trace_memory:
+            tracemalloc.start()
+        with CaptureQueriesContext(connection) as queries:
+            cpu, wall = time.process_time(), time.perf_counter()
+            run()
+            cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else 0
+        if trace_memory:
+            tracemalloc.stop()
+        transaction.set_rollback(True)
+    return {'cpu': cpu, 'wall': wall, 'peak': peak, 'queries': len(queries),
+            'requests': stub.request_count - requests_before}
+
+
+def run_benchmark(name: str, corpus: str, spec: CorpusSpec, workdir: str, stub: StubServer,
+                  repeat: int = 3) -> Result:
+    """Лучший из repeat прогонов по времени; память — в отдельном прогоне (tracemalloc замедляет код)"""
+    path = os.path.join(workdir, f'{corpus}.pdf')
+    if not os.path.exists(path):
+        generate_pdf(path, spec)
+
+    setup = BENCHMARKS[name]
+    runs = [_run_once(setup, path, stub, trace_memory=False) for _ in range(repeat)]
+    memory = _run_once(setup, path, stub, trace_memory=True)
+    best = min(runs, key=lambda run: run['cpu'])
+    pages = spec.pages
+    return Result(name, corpus, pages, {
+        'cpu_ms_per_page': round(1000 * best['cpu'] / pages, 3),
+        'wall_ms_per_page': round(1000 * best['wall'] / pages, 3),
+        'peak_kb': round(memory['peak'] / 1024, 1),
+        'queries_per_page': round(best['queries'] / pages, 3),
+        'requests_per_page': round(best['requests'] / pages, 3),
+    })
+
+
+def run_suite(corpora: dict[str, CorpusSpec], benchmarks: list[str], latency: float = 0.0,
+              repeat: int = 3) -> list[Result]:
+    # Документы бенчмарка ссылаются на файлы во временном каталоге, подставленном как MEDIA_ROOT
+    with tempfile.TemporaryDirectory() as workdir, override_settings(MEDIA_ROOT=workdir), \
+            stubbed_providers(latency) as stub:
+        return [
+            run_benchmark(name, corpus, spec, workdir, stub, repeat)
+            for corpus, spec in corpora.items()
+            for name in benchmarks
+        ]
+
+
+def load_baselines(path: str = BASELINES_PATH) -> dict:
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baselines(results: list[Result], path: str = BASELINES_PATH):
+    baselines = load_baselines(path)
+    for result in results:
+        baselines.setdefault(result.corpus, {})[result.benchmark] = {
+            metric: result.metrics[metric] for metric in COMPARED_METRICS
+        }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baselines, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def compare_with_baselines(results: list[Result], baselines: dict, tolerance: float = 0.25) -> list[Result]:
+    """Отметка метрик, превысивших базовые значения больше чем на tolerance; возвращает результаты с регрессиями"""
+    regressed = []
+    for result in results:
+        baseline = baselines.get(result.corpus, {}).get(result.benchmark)
+        if not baseline:
+            continue
+        for metric in COMPARED_METRICS:
+            expected, actual = baseline.get(metric), result.metrics[metric]
+            # Абсолютный допуск для метрик, близких к нулю (число запросов, доли миллисекунды)
+            if expected is not None and actual > expected * (1 + tolerance) + 0.01:
+                result.regressions.append(f'{metric}: {actual} > {expected}')
+        if result.regressions:
+            regressed.append(result)
+    return regressed
@@ -0,0 +1,80 @@
+import json
+import re
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Локальная заглушка LLM и OCR API с настраиваемой задержкой ответа: бенчмарки не зависят
+# от сети и квот провайдеров, а задержка имитирует время ответа настоящего API.
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.record(self.path)
+        time.sleep(self.server.latency)
+
+        if 'multipart/form-data' in self.headers.get('Content-Type', ''):
+            answer = {'text': 'recognized text of the scanned page'}
+        else:
+            answer = self._llm_answer(json.loads(body or b'{}'))
+        data = json.dumps(answer, ensure_ascii=False).encode()
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    @staticmethod
+    def _llm_answer(payload: dict) -> dict:
+        if 'messages' in payload:
+            prompt = payload['messages'][-1]['content']
+            # Вердикт «скан/текст» или извлечение материалов
+            content = 'text' if prompt.startswith('Анализ документа') else '[]'
+            return {'choices': [{'message': {'content': content}}]}
+        numbers = re.findall(r'=== Страница (\d+) ===', payload.get('prompt', ''))
+        if numbers:
+            text = json.dumps({number: 'другое' for number in numbers}, ensure_ascii=False)
+        else:
+            text = 'другое'
+        return {'choices': [{'text': text}]}
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    """Заглушка в отдельном потоке: with StubServer(latency=0.05) as stub: ... stub.url"""
+    daemon_threads = True
+
+    def __init__(self, latency: float = 0.0, port: int = 0):
+        super().__init__(('127.0.0.1', port), StubHandler)
+        self.latency = latency
+        self.requests = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def record(self, path: str):
+        with self._lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    @property
+    def request_count(self) -> int:
+        return sum(self.requests.values())
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,117 @@
+from functools import partial
+from operator import attrgetter
+from typing import Iterable, Iterator
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import Field
+from psycopg2 import Binary
+from psycopg2.extras import Json
+
+# Массовая загрузка строк через COPY FROM STDIN (PostgreSQL): строки передаются потоком в формате CSV
+# без построения многострочных INSERT, что в разы быстрее bulk_create на десятках тысяч текстовых блоков.
+# Значения полей готовятся так же, как в ORM (pre_save и get_db_prep_save), первичные ключи
+# резервируются из последовательности таблицы одним запросом. На других СУБД — bulk_create.
+
+NULL = '\\N'
+
+
+class CsvRowsReader:
+    """Файлоподобный поток строк CSV для copy_expert: строки формируются по мере чтения"""
+
+    def __init__(self, rows: Iterator[str]):
+        self.rows = rows
+        self.buffer = ''
+
+    def read(self, size=-1) -> str:
+        size = 64 * 1024 if size is None or size < 0 else size
+        parts, length = [self.buffer], len(self.buffer)
+        while length < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            parts.append(row)
+            length += len(row)
+        data = ''.join(parts)
+        self.buffer = data[size:]
+        return data[:size]
+
+
+def _quote(value: str) -> str:
+    # Строки всегда в кавычках: пустая строка и текст «\N» не спутаются с NULL
+    return '"' + value.replace('"', '""') + '"'
+
+
+_FORMATTERS = {
+    str: _quote,
+    float: repr,
+    int: str,
+    bool: lambda value: 't' if value else 'f',
+    type(None): lambda value: NULL,
+    Json: lambda value: _quote(value.dumps(value.adapted)),
+    Binary: lambda value: '\\x' + bytes(value.adapted).hex(),
+}
+
+
+def _csv_value(value) -> str:
+    formatter = _FORMATTERS.get(type(value))
+    if formatter is None:
+        # Даты, Decimal, UUID и т.п. — в текстовом представлении, которое понимает PostgreSQL
+        return _quote(str(value))
+    return formatter(value)
+
+
+def _reserve_ids(model, count: int) -> list[int]:
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)',
+            [connection.ops.quote_name(table), model._meta.pk.column, count],
+        )
+        return sorted(row[0] for row in cursor.fetchall())
+
+
+def copy_insert(model, objs: Iterable, set_pks: bool = True) -> list:
+    """Вставка объектов модели (аналог bulk_create)
+
+    set_pks — проставить объектам первичные ключи (нужны, если на строки ссылаются другие объекты);
+    иначе ключи назначает СУБД и объекты остаются без pk.
+    """
+    objs = list(objs)
+    if not objs:
+        return objs
+    if connection.vendor != 'postgresql':
+        return model.objects.bulk_create(objs)
+
+    fields = [field for field in model._meta.concrete_fields if set_pks or not field.primary_key]
+    if set_pks:
+        for obj, pk in zip(objs, _reserve_ids(model, len(objs))):
+            obj.pk = pk
+
+    # Значения без прокси django.db.connection и с pre_save только там, где он переопределен (auto_now и т.п.)
+    db = connections[DEFAULT_DB_ALIAS]
+    getters = [
+        attrgetter(field.attname) if type(field).pre_save is Field.pre_save else partial(field.pre_save, add=True)
+        for field in fields
+    ]
+    # Для простых полей (числа, строки) достаточно get_prep_value, остальные готовятся как в ORM
+    preparers = [
+        field.get_prep_value if type(field).get_db_prep_value is Field.get_db_prep_value
+        else partial(field.get_db_prep_save, connection=db)
+        for field in fields
+    ]
+
+    def rows():
+        for obj in objs:
+            values = [prepare(get(obj)) for get, prepare in zip(getters, preparers)]
+            yield ','.join(map(_csv_value, values)) + '\n'
+
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    sql = (f'COPY {connection.ops.quote_name(model._meta.db_table)} ({columns}) '
+           f"FROM STDIN WITH (FORMAT csv, NULL '{NULL}')")
+    with connection.cursor() as cursor:
+        cursor.copy_expert(sql, CsvRowsReader(rows()))
+
+    for obj in objs:
+        obj._state.adding = False
+        obj._state.db = connection.alias
+    return objs
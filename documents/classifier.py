@@ -0,0 +1,202 @@
+import json
+import math
+import os
+import re
+
+from collections import Counter
+from typing import Iterable, Optional
+
+from documents.conf import LOCAL_CLASSIFIER_MODEL_PATH
+from documents.scoring import TextFeatures, score_text
+
+# Локальная классификация страниц до обращения к LLM: правила по ключевым фразам
+# и наивный байесовский классификатор по словам текста и признакам разметки страницы.
+
+WORD_RE = re.compile(r'[^\W\d_]{3,}')
+
+# (метка, уверенность, фразы) — фраза должна начинать один из заголовков страницы: первых HEADING_LINES
+# непустых строк длиной до HEADING_MAX_LENGTH символов (упоминание фразы в тексте не считается)
+RULES = [
+    ('сертификат', 0.95, ('сертификат соответствия', 'сертификат качества', 'certificate of conformity',
+                          'inspection certificate', 'декларация о соответствии')),
+    ('титульный лист', 0.9, ('титульный лист',)),
+    ('техническая характеристика', 0.9, ('технические характеристики', 'техническая характеристика',
+                                         'technical characteristics', 'technical data')),
+]
+HEADING_LINES = 5
+HEADING_MAX_LENGTH = 120
+# Нумерация разделов перед заголовком: «2.», «1.3)», «II.»
+HEADING_NUMBER_RE = re.compile(r'^(?:[\dIVX]+[.)]\s*)+')
+
+
+def _bucket(value: float) -> int:
+    """Логарифмическая корзина для числовых признаков"""
+    return int(math.log2(value + 1))
+
+
+def page_tokens(text: str, blocks: Iterable = (), width: Optional[float] = None,
+                height: Optional[float] = None, features: Optional[TextFeatures] = None) -> list[str]:
+    """Признаки страницы: слова текста и служебные токены плотности текста, качества текста и геометрии блоков
+
+    features — заранее посчитанные признаки первых 4000 символов текста (score_texts для пачки страниц).
+    """
+    text = text[:4000]
+    features = features or score_text(text)
+    words = WORD_RE.findall(text.lower())
+    tokens = list(words)
+
+    blocks = list(blocks)
+    tokens.append(f'__chars:{_bucket(len(text))}')
+    tokens.append(f'__words:{_bucket(len(words))}')
+    tokens.append(f'__digits:{round(10 * features.digits / len(text)) if text else 0}')
+    tokens.append(f'__ocr:{round(10 * min(features.ocr_error_rate, 1))}')
+    tokens.append(f'__special:{_bucket(features.special_chars)}')
+    tokens.append(f'__blocks:{_bucket(len(blocks))}')
+    if blocks and width and height:
+        area = sum((block.x1 - block.x0) * (block.y1 - block.y0) for block in blocks)
+        tokens.append(f'__coverage:{round(10 * min(area / (width * height), 1))}')
+        # Текст только в верхней или нижней части листа типичен для титульных листов и штампов
+        top = min(block.y0 for block in blocks) / height
+        bottom = max(block.y1 for block in blocks) / height
+        tokens.append(f'__span:{round(5 * top)}:{round(5 * bottom)}')
+    return tokens
+
+
+def page_headings(text: str) -> list[str]:
+    """Строки-заголовки в начале страницы (в нижнем регистре, без нумерации разделов)"""
+    lines = (line.strip() for line in text[:2000].splitlines())
+    headings = [line for line in lines if line][:HEADING_LINES]
+    return [HEADING_NUMBER_RE.sub('', line).lower() for line in headings if len(line) <= HEADING_MAX_LENGTH]
+
+
+def rule_based_label(text: str) -> tuple[Optional[str], float]:
+    headings = page_headings(text)
+    for label, confidence, phrases in RULES:
+        if any(heading.startswith(phrases) for heading in headings):
+            return label, confidence
+    return None, 0.0
+
+
+class NaiveBayesModel:
+    """Мультиномиальный наивный байесовский классификатор со сглаживанием Лапласа
+
+    Апостериорные вероятности наивного Байеса почти всегда близки к 0 или 1 (токены считаются
+    независимыми), поэтому оценки калибруются температурой: softmax(log-оценки / temperature),
+    где temperature подбирается на отложенной выборке (fit_temperature).
+    """
+
+    def __init__(self, priors: dict, likelihoods: dict, unknown: dict, temperature: float = 1.0):
+        self.priors = priors            # {метка: log P(метка)}
+        self.likelihoods = likelihoods  # {метка: {токен: log P(токен | метка)}}
+        self.unknown = unknown          # {метка: log P(неизвестный токен | метка)}
+        self.temperature = temperature
+
+    @classmethod
+    def fit(cls, samples: Iterable[tuple[list[str], str]], max_features: int = 5000) -> 'NaiveBayesModel':
+        label_counts = Counter()
+        token_counts = {}
+        vocabulary = Counter()
+        for tokens, label in samples:
+            label_counts[label] += 1
+            token_counts.setdefault(label, Counter()).update(tokens)
+            vocabulary.update(tokens)
+
+        features = {token for token, _ in vocabulary.most_common(max_features)}
+        total = sum(label_counts.values())
+        priors, likelihoods, unknown = {}, {}, {}
+        for label, count in label_counts.items():
+            counts = token_counts[label]
+            denominator = sum(counts[token] for token in features) + len(features) + 1
+            priors[label] = math.log(count / total)
+            likelihoods[label] = {
+                token: math.log((counts[token] + 1) / denominator) for token in features if counts[token]
+            }
+            unknown[label] = math.log(1 / denominator)
+        return cls(priors, likelihoods, unknown)
+
+    def scores(self, tokens: list[str]) -> dict[str, float]:
+        """Логарифмы совместной вероятности страницы и каждой метки"""
+        return {
+            label: prior + sum(self.likelihoods[label].get(token, self.unknown[label]) for token in tokens)
+            for label, prior in self.priors.items()
+        }
+
+    @staticmethod
+    def _probabilities(scores: dict[str, float], temperature: float) -> dict[str, float]:
+        top = max(scores.values())
+        weights = {label: math.exp((score - top) / temperature) for label, score in scores.items()}
+        normalizer = sum(weights.values())
+        return {label: weight / normalizer for label, weight in weights.items()}
+
+    def predict(self, tokens: list[str]) -> tuple[Optional[str], float]:
+        """Метка и ее калиброванная вероятность"""
+        if not self.priors:
+            return None, 0.0
+        probabilities = self._probabilities(self.scores(tokens), self.temperature)
+        best = max(probabilities, key=probabilities.get)
+        return best, probabilities[best]
+
+    def fit_temperature(self, samples: list[tuple[list[str], str]]) -> float:
+        """Подбор температуры по минимуму логарифмической потери на отложенных страницах"""
+        scored = [(self.scores(tokens), label) for tokens, label in samples if label in self.priors]
+        if not scored:
+            return self.temperature
+
+        def loss(log_temperature: float) -> float:
+            temperature = math.exp(log_temperature)
+            return -sum(math.log(max(self._probabilities(scores, temperature)[label], 1e-12))
+                        for scores, label in scored)
+
+        # Потеря унимодальна по log(temperature): тернарный поиск на отрезке [1, e^8]
+        low, high = 0.0, 8.0
+        for _ in range(40):
+            left, right = low + (high - low) / 3, high - (high - low) / 3
+            if loss(left) < loss(right):
+                high = right
+            else:
+                low = left
+        self.temperature = math.exp((low + high) / 2)
+        return self.temperature
+
+    def to_dict(self) -> dict:
+        return {'priors': self.priors, 'likelihoods': self.likelihoods, 'unknown': self.unknown,
+                'temperature': self.temperature}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'NaiveBayesModel':
+        return cls(data['priors'], data['likelihoods'], data['unknown'], data.get('temperature', 1.0))
+
+    def save(self, path: str = LOCAL_CLASSIFIER_MODEL_PATH):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+_loaded_model = {'mtime': None, 'model': None}
+
+
+def load_model(path: str = LOCAL_CLASSIFIER_MODEL_PATH) -> Optional[NaiveBayesModel]:
+    """Модель из файла; перечитывается только после переобучения (по времени изменения файла)"""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    if _loaded_model['mtime'] != mtime:
+        with open(path, encoding='utf-8') as f:
+            _loaded_model['model'] = NaiveBayesModel.from_dict(json.load(f))
+        _loaded_model['mtime'] = mtime
+    return _loaded_model['model']
+
+
+def classify_page_locally(text: str, blocks: Iterable = (), width: Optional[float] = None,
+                          height: Optional[float] = None,
+                          features: Optional[TextFeatures] = None) -> tuple[Optional[str], float]:
+    """Метка страницы и уверенность без обращения к LLM"""
+    label, confidence = rule_based_label(text)
+    if model := load_model():
+        model_label, model_confidence = model.predict(page_tokens(text, blocks, width, height, features))
+        if model_confidence > confidence:
+            return model_label, model_confidence
+    return label, confidence
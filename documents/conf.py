@@ -7,3 +7,101 @@ LLM_API_URL = os.getenv('LLM_API_URL', 'https://api.deepseek.com/v1/chat/complet
 LLM_CLASSIFY_URL = os.getenv('LLM_CLASSIFY_URL')
 LLM_API_KEY = os.getenv('LLM_API_KEY')
 LLM_TOKEN = os.getenv('LLM_TOKEN')
+
+# Шардированный разбор PDF: размер шарда в страницах (0 — без шардирования)
+# и максимальное число шардов, обрабатываемых параллельно
+PDF_SHARD_SIZE = int(os.getenv('PDF_SHARD_SIZE', '200'))
+PDF_SHARD_MAX_PARALLEL = int(os.getenv('PDF_SHARD_MAX_PARALLEL', '4'))
+
+# Задачи разбора PDF: мягкий лимит времени (сек, меньше CELERY_TASK_TIME_LIMIT), после которого
+# задача перезапускается и продолжает разбор с контрольной точки, и число таких перезапусков
+PDF_PARSE_SOFT_TIME_LIMIT = int(os.getenv('PDF_PARSE_SOFT_TIME_LIMIT', str(25 * 60)))
+PDF_PARSE_MAX_RETRIES = int(os.getenv('PDF_PARSE_MAX_RETRIES', '5'))
+
+# Документ с тем же содержимым еще обрабатывается: разбор откладывается на PDF_DUPLICATE_WAIT сек
+# (не более PDF_DUPLICATE_MAX_WAITS раз, затем документ разбирается сам), чтобы скопировать готовый результат
+PDF_DUPLICATE_WAIT = int(os.getenv('PDF_DUPLICATE_WAIT', '60'))
+PDF_DUPLICATE_MAX_WAITS = int(os.getenv('PDF_DUPLICATE_MAX_WAITS', '30'))
+
+# Потоковый разбор PDF: страницы и блоки сохраняются пачками по PDF_BATCH_SIZE страниц
+# в отдельной транзакции (0 — одна пачка на весь документ)
+PDF_BATCH_SIZE = int(os.getenv('PDF_BATCH_SIZE', '50'))
+
+# Конкурентные вызовы LLM: число одновременных запросов (1 — последовательный режим)
+# и размер пачки результатов, сохраняемых одним запросом к БД
+LLM_CONCURRENCY = int(os.getenv('LLM_CONCURRENCY', '8'))
+LLM_SAVE_BATCH_SIZE = int(os.getenv('LLM_SAVE_BATCH_SIZE', '50'))
+
+# Модель LLM (входит в ключ кэша ответов)
+LLM_MODEL = os.getenv('LLM_MODEL', 'deepseek-chat')
+
+# Кэш ответов LLM: время жизни по типам вызовов (сек) и максимальное число записей
+LLM_CACHE_TTLS = {
+    'scan': int(os.getenv('LLM_CACHE_TTL_SCAN', str(60 * 60))),
+    'classify': int(os.getenv('LLM_CACHE_TTL_CLASSIFY', str(30 * 24 * 60 * 60))),
+    'materials': int(os.getenv('LLM_CACHE_TTL_MATERIALS', str(30 * 24 * 60 * 60))),
+}
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '100000'))
+
+# Пакетная классификация: бюджет токенов одного запроса с несколькими страницами (0 — по одной странице)
+LLM_CLASSIFY_BATCH_TOKENS = int(os.getenv('LLM_CLASSIFY_BATCH_TOKENS', '6000'))
+
+# Локальный классификатор страниц: страницы с уверенностью ниже порога уходят в LLM
+# (порог больше 1 отключает локальную классификацию)
+LOCAL_CLASSIFIER_THRESHOLD = float(os.getenv('LOCAL_CLASSIFIER_THRESHOLD', '0.9'))
+LOCAL_CLASSIFIER_MODEL_PATH = os.getenv('LOCAL_CLASSIFIER_MODEL_PATH', 'var/page_classifier.json')
+
+# Рендер страниц для OCR: пределы DPI, максимальный размер растра в пикселях и качество JPEG
+OCR_MIN_DPI = int(os.getenv('OCR_MIN_DPI', '150'))
+OCR_MAX_DPI = int(os.getenv('OCR_MAX_DPI', '300'))
+OCR_MAX_PIXELS = int(os.getenv('OCR_MAX_PIXELS', str(2480 * 3508)))  # A4 при 300 dpi
+OCR_JPEG_QUALITY = int(os.getenv('OCR_JPEG_QUALITY', '80'))
+
+# Таймаут запроса к OCR-провайдеру (сек): зависший запрос не должен занимать поток воркера
+# (пул потоков не применяет лимиты времени задач); меньше OCR_SLOT_TIMEOUT
+OCR_REQUEST_TIMEOUT = float(os.getenv('OCR_REQUEST_TIMEOUT', '60'))
+
+# Дисковый кэш растров страниц для OCR: каталог и предельный общий объем (байт, 0 — без кэша)
+RASTER_CACHE_DIR = os.getenv('RASTER_CACHE_DIR', 'var/raster_cache')
+RASTER_CACHE_MAX_BYTES = int(os.getenv('RASTER_CACHE_MAX_BYTES', str(2 * 1024 * 1024 * 1024)))
+
+# Ограничение нагрузки на провайдеров: запросов в секунду (rate) с запасом burst,
+# пределы адаптивного (AIMD) числа параллельных запросов и время жизни занятого слота (сек)
+PROVIDER_LIMITS = {
+    'ocr': {
+        'rate': float(os.getenv('OCR_RATE_PER_SEC', '5')),
+        'burst': int(os.getenv('OCR_BURST', '10')),
+        'min_concurrency': int(os.getenv('OCR_MIN_CONCURRENCY', '1')),
+        'max_concurrency': int(os.getenv('OCR_MAX_CONCURRENCY', '8')),
+        'slot_timeout': int(os.getenv('OCR_SLOT_TIMEOUT', '120')),
+    },
+    'llm': {
+        'rate': float(os.getenv('LLM_RATE_PER_SEC', '10')),
+        'burst': int(os.getenv('LLM_BURST', '20')),
+        'min_concurrency': int(os.getenv('LLM_MIN_CONCURRENCY', '1')),
+        'max_concurrency': int(os.getenv('LLM_MAX_CONCURRENCY', '16')),
+        'slot_timeout': int(os.getenv('LLM_SLOT_TIMEOUT', '120')),
+    },
+}
+PROVIDER_MAX_RETRIES = int(os.getenv('PROVIDER_MAX_RETRIES', '5'))
+PROVIDER_BACKOFF_BASE = float(os.getenv('PROVIDER_BACKOFF_BASE', '1.0'))
+# Наибольшая пауза по Retry-After внутри задачи (сек): если провайдер просит ждать дольше,
+# вызов завершается RateLimitedError и задача повторяется средствами Celery, не занимая поток
+PROVIDER_MAX_RETRY_AFTER = float(os.getenv('PROVIDER_MAX_RETRY_AFTER', '60'))
+
+# Хранение текстовых блоков страниц: rows — строки TextBlock (нужны для поиска по области),
+# packed — одно упакованное значение Page.packed_blocks, both — оба варианта
+TEXT_BLOCK_STORAGE = os.getenv('TEXT_BLOCK_STORAGE', 'rows')
+
+# Потоковая выгрузка NDJSON: число строк, читаемых из серверного курсора за раз
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', '500'))
+
+# Загрузка по частям: размер части по умолчанию и предельный размер файла (байт)
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', str(8 * 1024 * 1024)))
+UPLOAD_MAX_SIZE = int(os.getenv('UPLOAD_MAX_SIZE', str(2 * 1024 * 1024 * 1024)))
+
+# Конвейер обработки: число страниц в одной задаче OCR (задачи выполняются параллельно)
+PIPELINE_OCR_PAGES_PER_TASK = int(os.getenv('PIPELINE_OCR_PAGES_PER_TASK', '20'))
+
+# Метрики: интервал сброса накопленных в процессе значений в Redis (сек)
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '1.0'))
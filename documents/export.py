@@ -0,0 +1,40 @@
+import json
+
+from typing import Iterator, Optional
+
+from documents.conf import EXPORT_CHUNK_SIZE
+from documents.models import Document, TextBlock
+from documents.packed_blocks import PackedBlocks
+
+PAGE_FIELDS = ('id', 'number', 'is_scanned', 'raw_text', 'ocr_text', 'classification', 'width', 'height')
+BLOCK_FIELDS = ('page_id', 'x0', 'y0', 'x1', 'y1', 'text')
+
+
+def iter_document_ndjson(document: Document, page_from: Optional[int] = None, page_to: Optional[int] = None,
+                         chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[str]:
+    """Страницы документа с текстовыми блоками в формате NDJSON: одна страница — одна строка
+
+    Страницы и блоки читаются двумя серверными курсорами (iterator) в порядке номеров страниц
+    и сливаются на лету, поэтому память не зависит от размера документа.
+    """
+    pages = document.pages.order_by('number')
+    blocks = TextBlock.objects.filter(page__document=document).order_by('page__number', 'id')
+    if page_from is not None:
+        pages = pages.filter(number__gte=page_from)
+        blocks = blocks.filter(page__number__gte=page_from)
+    if page_to is not None:
+        pages = pages.filter(number__lte=page_to)
+        blocks = blocks.filter(page__number__lte=page_to)
+
+    blocks_iter = blocks.values_list(*BLOCK_FIELDS).iterator(chunk_size=chunk_size)
+    block = next(blocks_iter, None)
+    for *values, packed in pages.values_list(*PAGE_FIELDS, 'packed_blocks').iterator(chunk_size=chunk_size):
+        page = dict(zip(PAGE_FIELDS, values))
+        page['blocks'] = []
+        while block is not None and block[0] == page['id']:
+            page['blocks'].append(dict(zip(BLOCK_FIELDS[1:], block[1:])))
+            block = next(blocks_iter, None)
+        if packed is not None:
+            # Упакованные блоки (режим packed или both) — вместо строк TextBlock
+            page['blocks'] = [packed_block._asdict() for packed_block in PackedBlocks(packed)]
+        yield json.dumps(page, ensure_ascii=False) + '\n'
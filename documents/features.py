@@ -0,0 +1,56 @@
+import fitz
+
+from dataclasses import dataclass, field
+
+# Те же флаги, что у get_text("dict"): блоки изображений нужны для оценки покрытия страницы
+TEXTPAGE_FLAGS = fitz.TEXTFLAGS_BLOCKS | fitz.TEXT_PRESERVE_IMAGES
+
+
+@dataclass
+class PageFeatures:
+    """Признаки страницы PDF, извлеченные за один проход по ее содержимому"""
+    raw_text: str
+    width: float
+    height: float
+    blocks: list = field(default_factory=list)  # непустые текстовые блоки: [x0, y0, x1, y1, text]
+    image_area: float = 0.0
+    text_area: float = 0.0
+
+    @property
+    def page_area(self) -> float:
+        return self.width * self.height
+
+    @property
+    def image_coverage(self) -> float:
+        """Доля площади страницы, покрытая изображениями"""
+        return self.image_area / self.page_area if self.page_area > 0 else 0.0
+
+    @property
+    def text_coverage(self) -> float:
+        """Доля площади страницы, покрытая текстовыми блоками"""
+        return self.text_area / self.page_area if self.page_area > 0 else 0.0
+
+    @classmethod
+    def from_page(cls, page_obj) -> 'PageFeatures':
+        """Разбор страницы: один TextPage вместо отдельных get_text() для текста, блоков и словаря"""
+        textpage = page_obj.get_textpage(flags=TEXTPAGE_FLAGS)
+
+        blocks = []
+        image_area = 0.0
+        text_area = 0.0
+        for x0, y0, x1, y1, text, _, block_type in textpage.extractBLOCKS():
+            area = (x1 - x0) * (y1 - y0)
+            if block_type == 1:
+                image_area += area
+            elif text.strip():
+                text_area += area
+                blocks.append([x0, y0, x1, y1, text.strip()])
+
+        return cls(
+            raw_text=textpage.extractText().strip(),
+            width=page_obj.rect.width,
+            height=page_obj.rect.height,
+            blocks=blocks,
+            image_area=image_area,
+            text_area=text_area,
+        )
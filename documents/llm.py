@@ -1,38 +1,267 @@
+import asyncio
 import httpx
 import json
 import logging
+import re
 import requests
 
-from documents.conf import LLM_CLASSIFY_URL, LLM_TOKEN, LLM_API_URL, LLM_API_KEY
+from asgiref.sync import async_to_sync
 
+from documents import llm_cache, metrics
+from documents.conf import LLM_CLASSIFY_BATCH_TOKENS, LLM_CONCURRENCY, LLM_MODEL, LLM_TOKEN, LLM_API_URL, LLM_API_KEY
+from documents.ratelimit import aprovider_call, provider_call
 
-def classify_text_with_llm(text: str) -> str:
-    prompt = f'''
+# Версии шаблонов промптов входят в ключ кэша: при изменении промпта версию нужно увеличить
+CLASSIFY_PROMPT_VERSION = '2'
+CLASSIFY_BATCH_PROMPT_VERSION = '1'
+MATERIALS_PROMPT_VERSION = '1'
+
+# Метка страницы, для которой LLM не ответил (такие страницы классифицируются повторно)
+CLASSIFY_ERROR_LABEL = 'Ошибка'
+
+CLASSIFY_LABELS = ('сертификат', 'титульный лист', 'техническая характеристика', 'пустая', 'скан без текста', 'другое')
+
+
+def build_classify_prompt(text: str) -> str:
+    return f'''
     Ты — классификатор страниц технической документации. На основе текста снизу определи тип
     страницы. Возможные типы: сертификат, титульный лист, техническая характеристика, пустая,
     скан без текста, другое. Ответь ТОЛЬКО одним словом на русском языке, без пояснений.
     Текст: {text[:2000]}'''
 
+
+def completion_request_kwargs(prompt: str, max_tokens: int, timeout: int = 30) -> dict:
+    """Параметры запроса к completions API, общие для синхронного и асинхронного клиента"""
+    metrics.inc('docscope_llm_prompt_tokens_total', estimate_tokens(prompt), api='completions')
+    return {
+        'json': {"prompt": prompt, "max_tokens": max_tokens},
+        'headers': {
+            "Authorization": f"Bearer {LLM_TOKEN}" if LLM_TOKEN else "",
+            "Content-Type": "application/json"
+        },
+        'timeout': timeout,
+    }
+
+
+def classify_request_kwargs(text: str) -> dict:
+    return completion_request_kwargs(build_classify_prompt(text), max_tokens=10)
+
+
+def parse_classify_response(data: dict) -> str:
+    return data.get("choices", [{}])[0].get("text", "").strip().lower()
+
+
+def normalize_classify_label(label) -> str | None:
+    """Метка из CLASSIFY_LABELS без регистра, пробелов и точки на конце; None — ответ не из списка"""
+    if not isinstance(label, str):
+        return None
+    label = label.strip().strip('.').strip().lower()
+    return label if label in CLASSIFY_LABELS else None
+
+
+def classify_text_with_llm(text: str) -> str:
+    label = llm_cache.cached_call(
+        'classify', LLM_MODEL, CLASSIFY_PROMPT_VERSION, text[:2000], lambda: _request_classification(text))
+    return CLASSIFY_ERROR_LABEL if label is None else label
+
+
+def _request_classification(text: str) -> str | None:
+    try:
+        response = provider_call('llm', lambda: requests.post(LLM_API_URL, **classify_request_kwargs(text)))
+        response.raise_for_status()
+        return _valid_label(parse_classify_response(response.json()))
+    except Exception as e:
+        logging.warning(f'Ошибка при вызове LLM: {e}')
+        return None
+
+
+def _valid_label(response: str) -> str | None:
+    # Ответ не из списка типов не кэшируется: страница получит CLASSIFY_ERROR_LABEL и будет классифицирована повторно
+    if (label := normalize_classify_label(response)) is None:
+        logging.warning(f'LLM вернул неизвестный тип страницы: {response[:100]!r}')
+    return label
+
+
+async def aclassify_text_with_llm(client: httpx.AsyncClient, text: str) -> str:
+    """Асинхронная классификация через общий пул соединений client"""
+    label = await llm_cache.acached_call(
+        'classify', LLM_MODEL, CLASSIFY_PROMPT_VERSION, text[:2000], lambda: _arequest_classification(client, text))
+    return CLASSIFY_ERROR_LABEL if label is None else label
+
+
+async def _arequest_classification(client: httpx.AsyncClient, text: str) -> str | None:
     try:
-        response = requests.post(
-            LLM_API_URL,
-            json={"prompt": prompt, "max_tokens": 10},
-            headers={
-                "Authorization": f"Bearer {LLM_TOKEN}" if LLM_TOKEN else "",
-                "Content-Type": "application/json"
-            },
-            timeout=30
-        )
+        response = await aprovider_call('llm', lambda: client.post(LLM_API_URL, **classify_request_kwargs(text)))
         response.raise_for_status()
-        data = response.json()
-        return data.get("choices", [{}])[0].get("text", "").strip().lower()
+        return _valid_label(parse_classify_response(response.json()))
     except Exception as e:
         logging.warning(f'Ошибка при вызове LLM: {e}')
-        return 'Ошибка'
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка числа токенов (для русского текста ~3 символа на токен)"""
+    return len(text) // 3 + 1
+
+
+def build_classify_batch_prompt(texts: list[str]) -> str:
+    pages = '\n'.join(f'=== Страница {number} ===\n{text[:2000]}' for number, text in enumerate(texts, start=1))
+    return f'''
+    Ты — классификатор страниц технической документации. Для каждой страницы ниже определи ее тип.
+    Возможные типы: {', '.join(CLASSIFY_LABELS)}.
+    Ответь ТОЛЬКО JSON-объектом без пояснений, где ключ — номер страницы, значение — тип,
+    например: {{"1": "сертификат", "2": "другое"}}.
+{pages}'''
+
+
+def pack_classify_batches(texts: list[str], token_budget: int) -> list[list[int]]:
+    """Группировка индексов страниц в пачки, укладывающиеся в бюджет токенов запроса"""
+    overhead = estimate_tokens(build_classify_batch_prompt([]))
+    batches, batch, used = [], [], overhead
+    for index, text in enumerate(texts):
+        # Текст страницы, заголовок страницы и ее строка в ответе
+        cost = estimate_tokens(text[:2000]) + 20
+        if batch and used + cost > token_budget:
+            batches.append(batch)
+            batch, used = [], overhead
+        batch.append(index)
+        used += cost
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def classify_batch_max_tokens(count: int) -> int:
+    """Предел длины ответа на пакет: строка «"номер": "самый длинный тип",» на каждую страницу и скобки"""
+    entry = f'"{count}": "{max(CLASSIFY_LABELS, key=len)}", '
+    return estimate_tokens(entry) * count + 10
+
+
+_ANSWER_PAIR_RE = re.compile(r'"(\d+)"\s*:\s*"([^"]*)"')
+
+
+def parse_classify_batch_response(response: str, count: int) -> dict[int, str]:
+    """Разбор ответа на пакетную классификацию: {номер страницы: тип} только для корректных ответов"""
+    start, end = response.find('{'), response.rfind('}')
+    try:
+        data = json.loads(response[start:end + 1]) if start != -1 else {}
+    except json.JSONDecodeError:
+        data = None
+    if not isinstance(data, dict):
+        # Обрезанный или испорченный JSON: используются полные пары «"номер": "тип"»
+        data = dict(_ANSWER_PAIR_RE.findall(response))
+
+    labels = {}
+    for number in range(1, count + 1):
+        if label := normalize_classify_label(data.get(str(number))):
+            labels[number] = label
+    return labels
+
+
+def _classify_batch_request_kwargs(texts: list[str]) -> dict:
+    prompt = build_classify_batch_prompt(texts)
+    return completion_request_kwargs(prompt, max_tokens=classify_batch_max_tokens(len(texts)), timeout=60)
+
+
+def _request_classification_batch(texts: list[str]) -> dict[int, str] | None:
+    """Ответы LLM на пакет страниц; None — запрос не выполнен"""
+    try:
+        kwargs = _classify_batch_request_kwargs(texts)
+        response = provider_call('llm', lambda: requests.post(LLM_API_URL, **kwargs))
+        response.raise_for_status()
+        return parse_classify_batch_response(parse_classify_response(response.json()), len(texts))
+    except Exception as e:
+        logging.warning(f'Ошибка при пакетном вызове LLM: {e}')
+        return None
+
+
+async def _arequest_classification_batch(client: httpx.AsyncClient, texts: list[str]) -> dict[int, str] | None:
+    try:
+        kwargs = _classify_batch_request_kwargs(texts)
+        response = await aprovider_call('llm', lambda: client.post(LLM_API_URL, **kwargs))
+        response.raise_for_status()
+        return parse_classify_batch_response(parse_classify_response(response.json()), len(texts))
+    except Exception as e:
+        logging.warning(f'Ошибка при пакетном вызове LLM: {e}')
+        return None
+
+
+def _cached_labels(texts: list[str]) -> tuple[list[str], list[str | None]]:
+    """Ключи кэша и метки страниц из кэша (None — промах)
+
+    Ответы на пакетный промпт кэшируются отдельно от ответов на промпт одной страницы: у пакетного
+    промпта своя версия (CLASSIFY_BATCH_PROMPT_VERSION).
+    """
+    version = f'batch-{CLASSIFY_BATCH_PROMPT_VERSION}'
+    keys = [llm_cache.make_cache_key('classify', LLM_MODEL, version, text[:2000]) for text in texts]
+    return keys, [llm_cache.get_cached('classify', key) for key in keys]
+
+
+def _pack_missing(texts: list[str], labels: list[str | None], token_budget: int) -> list[list[int]]:
+    """Пакеты индексов страниц без метки"""
+    misses = [index for index, label in enumerate(labels) if label is None]
+    return [
+        [misses[position] for position in batch]
+        for batch in pack_classify_batches([texts[index] for index in misses], token_budget)
+    ]
+
+
+def _apply_batch_answers(labels: list[str | None], keys: list[str], indices: list[int], answers: dict[int, str] | None):
+    """Метки из ответа на пакет indices; пакет без ответа — CLASSIFY_ERROR_LABEL (не кэшируется)"""
+    for number, index in enumerate(indices, start=1):
+        if answers is None:
+            labels[index] = CLASSIFY_ERROR_LABEL
+        elif label := answers.get(number):
+            labels[index] = label
+            llm_cache.set_cached('classify', keys[index], label)
+
+
+def classify_texts_with_llm(texts: list[str], token_budget: int = LLM_CLASSIFY_BATCH_TOKENS) -> list[str]:
+    """Классификация нескольких страниц запросами, упакованными по бюджету токенов
+
+    Страницы, для которых пакетный ответ пришел, но без корректной метки, классифицируются по одной.
+    Если пакетный запрос не выполнен (перегрузка или недоступность LLM), его страницы получают
+    CLASSIFY_ERROR_LABEL и классифицируются повторно позже, а не отдельными запросами к тому же LLM.
+    """
+    keys, labels = _cached_labels(texts)
+    for indices in _pack_missing(texts, labels, token_budget):
+        _apply_batch_answers(labels, keys, indices, _request_classification_batch([texts[index] for index in indices]))
+    return [label if label is not None else classify_text_with_llm(text) for label, text in zip(labels, texts)]
+
+
+async def aclassify_texts_with_llm(client: httpx.AsyncClient, texts: list[str],
+                                   token_budget: int = LLM_CLASSIFY_BATCH_TOKENS,
+                                   concurrency: int = LLM_CONCURRENCY) -> list[str]:
+    """Асинхронный вариант classify_texts_with_llm: пакеты отправляются одновременно (не больше concurrency)"""
+    keys, labels = _cached_labels(texts)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send_batch(indices):
+        async with semaphore:
+            answers = await _arequest_classification_batch(client, [texts[index] for index in indices])
+        _apply_batch_answers(labels, keys, indices, answers)
+
+    async def send_single(index):
+        async with semaphore:
+            labels[index] = await aclassify_text_with_llm(client, texts[index])
+
+    await asyncio.gather(*(send_batch(indices) for indices in _pack_missing(texts, labels, token_budget)))
+    await asyncio.gather(*(send_single(index) for index, label in enumerate(labels) if label is None))
+    return labels
+
 
+def classify_texts_concurrently(texts: list[str], concurrency: int = LLM_CONCURRENCY) -> list[str]:
+    """Синхронная обертка aclassify_texts_with_llm с общим пулом HTTP-соединений"""
+    async def run():
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(limits=limits) as client:
+            return await aclassify_texts_with_llm(client, texts, concurrency=concurrency)
 
-def extract_materials_from_text(text: str) -> list[dict]:
-    prompt = f'''
+    return async_to_sync(run)()
+
+
+def build_materials_prompt(text: str) -> str:
+    return f'''
     Ты — инженер по качеству. Проанализируй следующий текст и извлеки список материалов с их характеристиками.
     Формат ответа:
     [
@@ -49,35 +278,87 @@ def extract_materials_from_text(text: str) -> list[dict]:
     ]
     Текст: {text[:4000]}  # Обрежем для безопасности'''
 
-    # Пример вызова LLM (DeepSeek или любой другой через API)
-    response = call_deepseek_api(prompt)
+
+def parse_materials_response(response: str) -> list[dict] | None:
+    """Разбор ответа LLM; None — ответ пустой, не является JSON или не является списком материалов"""
     try:
-        return json.loads(response)
+        data = json.loads(response)
     except json.JSONDecodeError:
-        print('LLM вернул невалидный JSON:')
-        print(response)
-        return []
+        logging.warning(f'LLM вернул невалидный JSON: {response[:1000]}')
+        return None
+    return validate_materials(data)
 
 
-def call_deepseek_api(prompt: str) -> str:
+def validate_materials(data) -> list[dict] | None:
+    """Материалы с непустым строковым name и словарем characteristics; None — ответ не является списком
+
+    Некорректные элементы списка отбрасываются. None не кэшируется, и страница обрабатывается повторно.
+    """
+    if not isinstance(data, list):
+        logging.warning(f'LLM вернул материалы не списком: {str(data)[:1000]}')
+        return None
+    materials = [
+        {'name': item['name'].strip(), 'characteristics': item.get('characteristics', {})}
+        for item in data
+        if isinstance(item, dict) and isinstance(item.get('name'), str) and item['name'].strip()
+        and isinstance(item.get('characteristics', {}), dict)
+    ]
+    if len(materials) < len(data):
+        logging.warning(f'LLM вернул некорректные материалы: отброшено {len(data) - len(materials)} из {len(data)}')
+    return materials
+
+
+def extract_materials_from_text(text: str) -> list[dict] | None:
+    """Материалы страницы; None — ошибка вызова LLM (страница будет обработана повторно)"""
+    # Пример вызова LLM (DeepSeek или любой другой через API)
+    return llm_cache.cached_call(
+        'materials', LLM_MODEL, MATERIALS_PROMPT_VERSION, text[:4000],
+        lambda: parse_materials_response(call_deepseek_api(build_materials_prompt(text)))
+    )
+
+
+async def aextract_materials_from_text(client: httpx.AsyncClient, text: str) -> list[dict] | None:
+    """Асинхронное извлечение материалов через общий пул соединений client (None — ошибка вызова)"""
+    async def request():
+        return parse_materials_response(await acall_deepseek_api(client, build_materials_prompt(text)))
+
+    return await llm_cache.acached_call('materials', LLM_MODEL, MATERIALS_PROMPT_VERSION, text[:4000], request)
+
+
+def deepseek_request_kwargs(prompt: str) -> dict:
+    """Параметры запроса к chat-completions API, общие для синхронного и асинхронного клиента"""
+    metrics.inc('docscope_llm_prompt_tokens_total', estimate_tokens(prompt), api='chat')
     headers = {
         "Authorization": f"Bearer {LLM_API_KEY}",
         "Content-Type": "application/json",
     }
 
     payload = {
-        "model": "deepseek-chat",  # Зависит от провайдера, например: deepseek-chat, gpt-3.5-turbo, mistral-7b
+        "model": LLM_MODEL,  # Зависит от провайдера, например: deepseek-chat, gpt-3.5-turbo, mistral-7b
         "messages": [
             {"role": "system", "content": "Ты — специалист по техдокументации"},
             {"role": "user", "content": prompt}
         ],
         "temperature": 0.2
     }
+    return {'headers': headers, 'json': payload, 'timeout': 30}
+
+
+def call_deepseek_api(prompt: str) -> str:
+    try:
+        response = provider_call('llm', lambda: httpx.post(LLM_API_URL, **deepseek_request_kwargs(prompt)))
+        response.raise_for_status()
+        return response.json()['choices'][0]['message']['content']
+    except Exception as e:
+        logging.warning(f'Ошибка при обращении к LLM API: {e}')
+        return ''
+
 
+async def acall_deepseek_api(client: httpx.AsyncClient, prompt: str) -> str:
     try:
-        response = httpx.post(LLM_API_URL, headers=headers, json=payload, timeout=30)
+        response = await aprovider_call('llm', lambda: client.post(LLM_API_URL, **deepseek_request_kwargs(prompt)))
         response.raise_for_status()
         return response.json()['choices'][0]['message']['content']
     except Exception as e:
-        print(f'Ошибка при обращении к LLM API: {e}')
+        logging.warning(f'Ошибка при обращении к LLM API: {e}')
         return ''
@@ -0,0 +1,86 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+from django_redis import get_redis_connection
+
+from documents import metrics
+from documents.conf import LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTLS
+
+# Общий кэш ответов LLM. Ключ — sha256 от модели, версии шаблона промпта и входного текста,
+# поэтому он одинаков во всех воркерах Celery и не зависит от перезапусков (в отличие от hash()).
+# Индекс последнего обращения (sorted set) ограничивает число записей по LRU. Попадания и промахи
+# по типу вызова — метрика docscope_llm_cache_requests_total (/metrics).
+INDEX_KEY = 'llm_cache:index'
+
+_MISSING = object()
+
+
+def make_cache_key(call_type: str, model: str, prompt_version: str, text: str) -> str:
+    digest = hashlib.sha256('\x1f'.join((model, prompt_version, text)).encode()).hexdigest()
+    return f'llm:{call_type}:{digest}'
+
+
+def _redis():
+    try:
+        return get_redis_connection('default')
+    except NotImplementedError:
+        # Кэш не в Redis (например, locmem в локальной разработке) — без индекса
+        return None
+
+
+def get_cached(call_type: str, key: str, default=None):
+    value = cache.get(key, _MISSING)
+    hit = value is not _MISSING
+    metrics.inc('docscope_llm_cache_requests_total', type=call_type, result='hit' if hit else 'miss')
+
+    if hit and (redis := _redis()):
+        redis.zadd(INDEX_KEY, {key: time.time()})
+
+    return value if hit else default
+
+
+def set_cached(call_type: str, key: str, value):
+    cache.set(key, value, timeout=LLM_CACHE_TTLS.get(call_type))
+    if redis := _redis():
+        now = time.time()
+        pipe = redis.pipeline()
+        pipe.zadd(INDEX_KEY, {key: now})
+        # Записи, к которым не обращались дольше максимального TTL, уже истекли в кэше
+        pipe.zremrangebyscore(INDEX_KEY, '-inf', now - max(LLM_CACHE_TTLS.values()))
+        pipe.zcard(INDEX_KEY)
+        size = pipe.execute()[-1]
+        if size > LLM_CACHE_MAX_ENTRIES:
+            _evict(redis, size - LLM_CACHE_MAX_ENTRIES)
+
+
+def _evict(redis, count: int):
+    """Удаление count давно не использованных записей"""
+    keys = [key.decode() for key in redis.zrange(INDEX_KEY, 0, count - 1)]
+    if keys:
+        cache.delete_many(keys)
+        redis.zrem(INDEX_KEY, *keys)
+
+
+def cached_call(call_type: str, model: str, prompt_version: str, text: str, compute):
+    """Результат compute() из кэша или с сохранением в кэш; None (ошибка вызова) не кэшируется"""
+    key = make_cache_key(call_type, model, prompt_version, text)
+    if (value := get_cached(call_type, key, _MISSING)) is not _MISSING:
+        return value
+
+    value = compute()
+    if value is not None:
+        set_cached(call_type, key, value)
+    return value
+
+
+async def acached_call(call_type: str, model: str, prompt_version: str, text: str, acompute):
+    """Асинхронный вариант cached_call для корутины acompute()"""
+    key = make_cache_key(call_type, model, prompt_version, text)
+    if (value := get_cached(call_type, key, _MISSING)) is not _MISSING:
+        return value
+
+    value = await acompute()
+    if value is not None:
+        set_cached(call_type, key, value)
+    return value
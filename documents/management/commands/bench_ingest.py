@@ -0,0 +1,58 @@
+import dataclasses
+
+from django.core.management.base import BaseCommand, CommandError
+
+from documents.benchmarks.corpus import CORPORA, CorpusSpec
+from documents.benchmarks.runner import (
+    BASELINES_PATH, BENCHMARKS, compare_with_baselines, load_baselines, run_suite, save_baselines)
+
+
+class Command(BaseCommand):
+    help = 'Бенчмарк разбора PDF на синтетическом корпусе со сравнением с базовыми значениями'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', action='append', choices=sorted(CORPORA),
+                            help='Набор из baselines (можно несколько); по умолчанию все')
+        parser.add_argument('--benchmark', action='append', choices=sorted(BENCHMARKS),
+                            help='Замер (можно несколько); по умолчанию все')
+        parser.add_argument('--pages', type=int, help='Свой корпус: число страниц (без сравнения с baselines)')
+        parser.add_argument('--lines', type=int, default=CorpusSpec.lines_per_page, help='Свой корпус: строк текста')
+        parser.add_argument('--images', type=float, default=0.0, help='Свой корпус: доля страниц-сканов')
+        parser.add_argument('--noise', type=float, default=0.0, help='Свой корпус: доля страниц с артефактами OCR')
+        parser.add_argument('--latency', type=float, default=0.0, help='Задержка ответа заглушки LLM/OCR, сек')
+        parser.add_argument('--repeat', type=int, default=3, help='Число прогонов (берется лучший)')
+        parser.add_argument('--tolerance', type=float, default=0.25, help='Допустимое превышение базовых значений')
+        parser.add_argument('--baselines', default=BASELINES_PATH, help='Файл базовых значений')
+        parser.add_argument('--update-baselines', action='store_true', help='Записать результаты как базовые')
+
+    def handle(self, *args, **options):
+        if options['pages']:
+            corpora = {'custom': CorpusSpec(
+                pages=options['pages'], lines_per_page=options['lines'],
+                image_ratio=options['images'], noise_ratio=options['noise'],
+            )}
+        else:
+            corpora = {name: CORPORA[name] for name in options['corpus'] or sorted(CORPORA)}
+        benchmarks = options['benchmark'] or list(BENCHMARKS)
+
+        for name, spec in corpora.items():
+            self.stdout.write(f'{name}: {dataclasses.asdict(spec)}')
+        results = run_suite(corpora, benchmarks, latency=options['latency'], repeat=options['repeat'])
+
+        regressed = compare_with_baselines(results, load_baselines(options['baselines']), options['tolerance'])
+        self.stdout.write(f'{"корпус":<10} {"замер":<26} {"CPU мс/стр":>11} {"стена мс/стр":>13} '
+                          f'{"пик КБ":>9} {"SQL/стр":>8} {"API/стр":>8}')
+        for result in results:
+            metrics = result.metrics
+            line = (f'{result.corpus:<10} {result.benchmark:<26} {metrics["cpu_ms_per_page"]:>11} '
+                    f'{metrics["wall_ms_per_page"]:>13} {metrics["peak_kb"]:>9} '
+                    f'{metrics["queries_per_page"]:>8} {metrics["requests_per_page"]:>8}')
+            self.stdout.write(self.style.ERROR(line) if result.regressions else line)
+            for regression in result.regressions:
+                self.stdout.write(self.style.ERROR(f'    регрессия {regression}'))
+
+        if options['update_baselines']:
+            save_baselines([result for result in results if result.corpus in CORPORA], options['baselines'])
+            self.stdout.write(self.style.SUCCESS(f'Базовые значения обновлены: {options["baselines"]}'))
+        elif regressed:
+            raise CommandError(f'Регрессия производительности в {len(regressed)} замерах')
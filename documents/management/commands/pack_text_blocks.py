@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from documents.models import Page, TextBlock
+from documents.packed_blocks import pack_blocks
+from documents.utils import iter_batches
+
+
+class Command(BaseCommand):
+    help = 'Перевод текстовых блоков страниц из строк TextBlock в упакованное значение Page.packed_blocks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--document', type=int, action='append', help='Только указанные документы')
+        parser.add_argument('--batch-size', type=int, default=500, help='Страниц в одной транзакции')
+        parser.add_argument('--delete-rows', action='store_true',
+                            help='Удалить строки TextBlock упакованных страниц (режим TEXT_BLOCK_STORAGE=packed)')
+
+    def handle(self, *args, **options):
+        condition = Q(packed_blocks__isnull=True)
+        if options['delete_rows']:
+            # Страницы, упакованные ранее в режиме both, — только удаление строк
+            condition |= Q(blocks__isnull=False)
+        pages = Page.objects.filter(condition)
+        if options['document']:
+            pages = pages.filter(document_id__in=options['document'])
+        page_ids = pages.order_by('id').values_list('id', flat=True).distinct()
+
+        packed = deleted = 0
+        for batch in iter_batches(page_ids.iterator(), options['batch_size']):
+            with transaction.atomic():
+                packed += self.pack_pages(batch)
+                if options['delete_rows']:
+                    deleted += TextBlock.objects.filter(page_id__in=batch).delete()[0]
+
+        self.stdout.write(self.style.SUCCESS(f'Упаковано страниц: {packed}, удалено строк TextBlock: {deleted}'))
+
+    @staticmethod
+    def pack_pages(page_ids: list[int]) -> int:
+        pages = list(Page.objects.filter(id__in=page_ids, packed_blocks__isnull=True).only('id'))
+        blocks = {}
+        rows = (
+            TextBlock.objects.filter(page_id__in=[page.id for page in pages])
+            .order_by('page_id', 'id')
+            .values_list('page_id', 'x0', 'y0', 'x1', 'y1', 'text')
+        )
+        for page_id, *block in rows.iterator():
+            blocks.setdefault(page_id, []).append(block)
+        for page in pages:
+            page.packed_blocks = pack_blocks(blocks.get(page.id, []))
+        Page.objects.bulk_update(pages, ['packed_blocks'])
+        return len(pages)
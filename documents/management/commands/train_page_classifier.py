@@ -0,0 +1,69 @@
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+
+from documents.classifier import NaiveBayesModel, page_tokens
+from documents.conf import LOCAL_CLASSIFIER_MODEL_PATH, LOCAL_CLASSIFIER_THRESHOLD
+from documents.llm import CLASSIFY_LABELS
+from documents.models import Page
+
+
+class Command(BaseCommand):
+    help = 'Обучение (обновление) локального классификатора страниц по разметке LLM'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=LOCAL_CLASSIFIER_MODEL_PATH, help='Путь к файлу модели')
+        parser.add_argument('--min-samples', type=int, default=50, help='Минимальное число размеченных страниц')
+        parser.add_argument('--max-features', type=int, default=5000, help='Размер словаря модели')
+        parser.add_argument('--holdout', type=float, default=0.2,
+                            help='Доля страниц, отложенных для калибровки уверенности и оценки точности')
+        parser.add_argument('--threshold', type=float, default=LOCAL_CLASSIFIER_THRESHOLD,
+                            help='Порог уверенности, для которого выводится точность')
+
+    def handle(self, *args, **options):
+        pages = (
+            Page.objects
+            .filter(classification_source=Page.SOURCE_LLM, classification__in=CLASSIFY_LABELS)
+            .exclude(raw_text='', ocr_text='')
+            .prefetch_related('blocks')
+            .order_by('id')
+        )
+
+        samples = [
+            (page_tokens(page.raw_text or page.ocr_text, page.get_blocks(), page.width, page.height),
+             page.classification)
+            for page in pages.iterator(chunk_size=500)
+        ]
+        if len(samples) < options['min_samples']:
+            raise CommandError(f'Недостаточно размеченных страниц: {len(samples)} < {options["min_samples"]}')
+        if len({label for _, label in samples}) < 2:
+            # Модель с одним классом была бы «уверена» в любой странице
+            raise CommandError('Для обучения нужны страницы как минимум двух типов')
+
+        # Отложенные страницы не участвуют в обучении: на них подбирается температура и считается точность
+        random.Random(0).shuffle(samples)
+        holdout_size = max(1, int(len(samples) * options['holdout']))
+        holdout, train = samples[:holdout_size], samples[holdout_size:]
+
+        model = NaiveBayesModel.fit(train, max_features=options['max_features'])
+        temperature = model.fit_temperature(holdout)
+        model.save(options['output'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Модель обучена на {len(train)} страницах ({len(model.priors)} классов), '
+            f'температура {temperature:.2f}: {options["output"]}'
+        ))
+        self.report(model, holdout, options['threshold'])
+
+    def report(self, model: NaiveBayesModel, holdout: list, threshold: float):
+        predictions = [(*model.predict(tokens), label) for tokens, label in holdout]
+        correct = sum(predicted == label for predicted, _, label in predictions)
+        confident = [(predicted, label) for predicted, confidence, label in predictions if confidence >= threshold]
+        confident_correct = sum(predicted == label for predicted, label in confident)
+        self.stdout.write(f'Отложено страниц: {len(holdout)}, точность: {correct / len(holdout):.1%}')
+        if confident:
+            self.stdout.write(
+                f'Порог {threshold}: локально {len(confident) / len(holdout):.1%} страниц '
+                f'с точностью {confident_correct / len(confident):.1%}, остальные — в LLM'
+            )
+        else:
+            self.stdout.write(f'Порог {threshold}: уверенность ниже порога на всех страницах, все — в LLM')
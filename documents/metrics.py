@@ -0,0 +1,190 @@
+import atexit
+import logging
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+
+from celery.signals import task_postrun
+from django_redis import get_redis_connection
+
+from documents.conf import METRICS_FLUSH_INTERVAL
+
+# Метрики конвейера в формате Prometheus, общие для всех процессов (воркеры gunicorn и Celery):
+# процесс копит приращения в памяти, а фоновый поток раз в METRICS_FLUSH_INTERVAL секунд (и конец
+# каждой задачи Celery) сбрасывает их в Redis-хэш одним pipeline; /metrics отдает суммарные значения.
+# Без Redis (локальная разработка) значения видны только в текущем процессе.
+# Скорость (страниц в секунду и т.п.) считается в Prometheus: rate(docscope_pages_total[5m]).
+
+VALUES_KEY = 'metrics:values'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# имя -> (тип, описание, границы корзин для гистограмм)
+METRICS = {
+    'docscope_stage_seconds': (
+        'histogram', 'Длительность шагов обработки (stage: pdf_extract, db_write, ocr_render, ...)', DEFAULT_BUCKETS),
+    'docscope_pages_total': ('counter', 'Обработанные страницы по этапам', None),
+    'docscope_provider_request_seconds': ('histogram', 'Время ответа внешних провайдеров', DEFAULT_BUCKETS),
+    'docscope_provider_requests_total': ('counter', 'Запросы к провайдерам по HTTP-статусу ответа', None),
+    'docscope_provider_retries_total': ('counter', 'Повторы запросов к провайдерам', None),
+    'docscope_provider_errors_total': ('counter', 'Ошибки провайдеров (сеть, исчерпанные повторы)', None),
+    'docscope_provider_sent_bytes_total': ('counter', 'Байт отправлено провайдерам', None),
+    'docscope_llm_prompt_tokens_total': ('counter', 'Оценка числа токенов в промптах LLM', None),
+    'docscope_llm_cache_requests_total': ('counter', 'Обращения к кэшу LLM (result: hit или miss)', None),
+    'docscope_raster_cache_requests_total': ('counter', 'Обращения к кэшу растров страниц (hit или miss)', None),
+}
+
+HISTOGRAM_SUFFIXES = ('_bucket', '_sum', '_count')
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _series(name: str, labels: dict) -> str:
+    if not labels:
+        return name
+    # Граница корзины гистограммы — последней меткой
+    keys = sorted(labels, key=lambda key: (key == 'le', key))
+    rendered = ','.join(f'{key}="{_escape(labels[key])}"' for key in keys)
+    return f'{name}{{{rendered}}}'
+
+
+def _format_bound(bound: float) -> str:
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+class MetricsBuffer:
+    """Локальные приращения метрик процесса с периодическим сбросом в Redis"""
+
+    def __init__(self):
+        self.pending = {}
+        self.local_totals = {}   # используется, если Redis недоступен
+        self.lock = threading.Lock()
+        self.flusher_pid = None
+
+    def add(self, series: str, value: float):
+        with self.lock:
+            self.pending[series] = self.pending.get(series, 0) + value
+            # Поток сброса запускается в каждом процессе (после fork воркера gunicorn/Celery потоки не наследуются)
+            if self.flusher_pid != os.getpid():
+                self.flusher_pid = os.getpid()
+                threading.Thread(target=self._flush_periodically, daemon=True).start()
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(METRICS_FLUSH_INTERVAL)
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return
+        redis = _redis()
+        if redis is None:
+            with self.lock:
+                for series, value in pending.items():
+                    self.local_totals[series] = self.local_totals.get(series, 0) + value
+            return
+        try:
+            pipe = redis.pipeline(transaction=False)
+            for series, value in pending.items():
+                pipe.hincrbyfloat(VALUES_KEY, series, value)
+            pipe.execute()
+        except Exception as e:
+            # Метрики не должны ронять обработку документов
+            logging.warning(f'Не удалось записать метрики: {e}')
+
+    def totals(self) -> dict:
+        self.flush()
+        redis = _redis()
+        if redis is None:
+            with self.lock:
+                return dict(self.local_totals)
+        return {series.decode(): float(value) for series, value in redis.hgetall(VALUES_KEY).items()}
+
+
+def _redis():
+    try:
+        return get_redis_connection('default')
+    except NotImplementedError:
+        return None
+
+
+_buffer = MetricsBuffer()
+atexit.register(_buffer.flush)
+
+
+def inc(name: str, value: float = 1, **labels):
+    _buffer.add(_series(name, labels), value)
+
+
+def observe(name: str, value: float, **labels):
+    """Наблюдение для гистограммы: корзины хранятся накопительно, как в формате Prometheus"""
+    buckets = METRICS[name][2]
+    for bound in (*buckets, float('inf')):
+        # Нулевые приращения нужны, чтобы в выдаче были все корзины гистограммы
+        _buffer.add(_series(f'{name}_bucket', {**labels, 'le': _format_bound(bound)}), int(value <= bound))
+    _buffer.add(_series(f'{name}_sum', labels), value)
+    _buffer.add(_series(f'{name}_count', labels), 1)
+
+
+@contextmanager
+def timer(name: str, **labels):
+    """Замер длительности блока в секундах (в том числе при исключении)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+def flush():
+    _buffer.flush()
+
+
+@task_postrun.connect
+def flush_after_task(**kwargs):
+    # Короткие задачи Celery не должны ждать следующего периодического сброса
+    flush()
+
+
+def _sort_key(series: str):
+    """Корзины гистограммы — по возрастанию границы, остальные серии — по имени"""
+    base, _, le = series.partition('le="')
+    if not le:
+        return series, 0.0
+    bound = le.split('"', 1)[0]
+    return base, float('inf') if bound == '+Inf' else float(bound)
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+def _family(series: str) -> str:
+    name = series.split('{', 1)[0]
+    for suffix in HISTOGRAM_SUFFIXES:
+        if name.endswith(suffix) and name[:-len(suffix)] in METRICS:
+            return name[:-len(suffix)]
+    return name
+
+
+def render() -> str:
+    """Все метрики в текстовом формате Prometheus (exposition format 0.0.4)"""
+    families = {}
+    for series, value in _buffer.totals().items():
+        families.setdefault(_family(series), []).append((series, value))
+
+    lines = []
+    for name in sorted(families):
+        if name in METRICS:
+            metric_type, description, _ = METRICS[name]
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {metric_type}')
+        for series, value in sorted(families[name], key=lambda item: _sort_key(item[0])):
+            lines.append(f'{series} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
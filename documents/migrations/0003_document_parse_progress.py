@@ -0,0 +1,35 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:47
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_parse_progress(apps, schema_editor):
+    # Документы, разобранные до появления контрольной точки, считаются разобранными полностью:
+    # иначе повторный разбор начнется с первой страницы и нарушит уникальность (document, number)
+    Document = apps.get_model('documents', 'Document')
+    Page = apps.get_model('documents', 'Page')
+    last_page = Page.objects.filter(document=OuterRef('pk')).order_by('-number').values('number')[:1]
+    Document.objects.filter(page_count__isnull=True, pages__isnull=False).distinct().update(
+        page_count=Subquery(last_page), parsed_pages=Subquery(last_page))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0002_alter_page_classification_material'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='page_count',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='parsed_pages',
+            field=models.PositiveIntegerField(default=0, help_text='Номер последней сохраненной страницы (контрольная точка разбора)'),
+        ),
+        migrations.RunPython(fill_parse_progress, migrations.RunPython.noop),
+    ]
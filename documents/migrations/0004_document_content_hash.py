@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0003_document_parse_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, help_text='SHA-256 содержимого файла (для поиска дубликатов)', max_length=64),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:51
+
+from django.db import migrations, models
+
+
+def mark_existing_llm_labels(apps, schema_editor):
+    # До появления локального классификатора страницы размечала только LLM
+    Page = apps.get_model('documents', 'Page')
+    Page.objects.exclude(classification__isnull=True).exclude(classification='').update(classification_source='llm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0004_document_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='page',
+            name='classification_source',
+            field=models.CharField(blank=True, choices=[('llm', 'LLM'), ('local', 'Локальный классификатор')], help_text='Кто определил тип страницы', max_length=16),
+        ),
+        migrations.RunPython(mark_existing_llm_labels, migrations.RunPython.noop),
+    ]
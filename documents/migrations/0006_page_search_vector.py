@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:57
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0005_page_classification_source'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='page',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='page',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='page_search_vector_gin'),
+        ),
+        migrations.RunSQL(
+            sql="""
+                UPDATE documents_page SET search_vector =
+                    setweight(to_tsvector('russian', coalesce(raw_text, '')), 'A')
+                    || setweight(to_tsvector('russian', coalesce(ocr_text, '')), 'B')
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
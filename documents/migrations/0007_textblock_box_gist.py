@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:59
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0006_page_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='textblock',
+            index=django.contrib.postgres.indexes.GistIndex(models.Func(models.Func(models.F('x0'), models.F('y0'), function='point'), models.Func(models.F('x1'), models.F('y1'), function='point'), function='box'), name='textblock_box_gist'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:00
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0007_textblock_box_gist'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='material',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['characteristics'], name='material_characteristics_gin', opclasses=['jsonb_path_ops']),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0009_upload_session'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='pipeline_status',
+            field=models.JSONField(blank=True, default=dict, help_text='Состояние этапов конвейера обработки: {этап: {status, started_at, ...}}'),
+        ),
+    ]
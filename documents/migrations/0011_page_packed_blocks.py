@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0010_document_pipeline_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='page',
+            name='packed_blocks',
+            field=models.BinaryField(help_text='Текстовые блоки страницы одним значением (см. documents.packed_blocks)', null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:57
+
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+
+def mark_extracted_pages(apps, schema_editor):
+    # Страницы, для которых материалы уже извлечены, не отправляются в LLM повторно
+    Page = apps.get_model('documents', 'Page')
+    Material = apps.get_model('documents', 'Material')
+    Page.objects.filter(Exists(Material.objects.filter(page=OuterRef('pk')))).update(
+        materials_extracted_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0011_page_packed_blocks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='page',
+            name='materials_extracted_at',
+            field=models.DateTimeField(editable=False, help_text='Когда выполнено извлечение материалов (в том числе с пустым результатом)', null=True),
+        ),
+        migrations.RunPython(mark_extracted_pages, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:06
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+# Нормализованные координаты существующих блоков — одним UPDATE по размеру страницы
+# (до построения индекса, чтобы не обновлять его построчно)
+FILL_NORMALIZED_BOX_SQL = """
+UPDATE documents_textblock AS b
+SET nx0 = b.x0 / p.width, ny0 = b.y0 / p.height, nx1 = b.x1 / p.width, ny1 = b.y1 / p.height
+FROM documents_page AS p
+WHERE b.page_id = p.id AND p.width > 0 AND p.height > 0
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0012_page_materials_extracted_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='textblock',
+            name='nx0',
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='textblock',
+            name='nx1',
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='textblock',
+            name='ny0',
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='textblock',
+            name='ny1',
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.RunSQL(FILL_NORMALIZED_BOX_SQL, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='textblock',
+            index=django.contrib.postgres.indexes.GistIndex(models.Func(models.Func(models.F('nx0'), models.F('ny0'), function='point'), models.Func(models.F('nx1'), models.F('ny1'), function='point'), function='box'), name='textblock_nbox_gist'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:11
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def mark_recognized_pages(apps, schema_editor):
+    # Страницы, уже получившие текст OCR, не отправляются на распознавание повторно
+    Page = apps.get_model('documents', 'Page')
+    Page.objects.filter(is_scanned=True).exclude(ocr_text='').update(ocr_done_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0013_textblock_normalized_box'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='page',
+            name='ocr_done_at',
+            field=models.DateTimeField(editable=False, help_text='Когда выполнен OCR страницы (в том числе с пустым результатом)', null=True),
+        ),
+        migrations.RunPython(mark_recognized_pages, migrations.RunPython.noop),
+    ]
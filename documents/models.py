@@ -1,16 +1,42 @@
+import uuid
+
+from typing import Sequence
+
+from django.contrib.postgres.indexes import GinIndex, GistIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models import F, Func
+
+from documents.packed_blocks import PackedBlocks
 
 
 class Document(models.Model):
     file = models.FileField(upload_to='documents/')
     uploaded_at = models.DateTimeField(auto_now_add=True)
     original_filename = models.CharField(max_length=255)
+    content_hash = models.CharField(
+        max_length=64, blank=True, db_index=True, help_text='SHA-256 содержимого файла (для поиска дубликатов)'
+    )
+    page_count = models.PositiveIntegerField(null=True, blank=True)
+    parsed_pages = models.PositiveIntegerField(
+        default=0, help_text='Номер последней сохраненной страницы (контрольная точка разбора)'
+    )
+    pipeline_status = models.JSONField(
+        default=dict, blank=True, help_text='Состояние этапов конвейера обработки: {этап: {status, started_at, ...}}'
+    )
 
     def __str__(self):
         return self.original_filename
 
+    @property
+    def is_parsed(self) -> bool:
+        return self.page_count is not None and self.parsed_pages >= self.page_count
+
 
 class Page(models.Model):
+    SOURCE_LLM = 'llm'
+    SOURCE_LOCAL = 'local'
+
     document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='pages')
     number = models.PositiveIntegerField()
     is_scanned = models.BooleanField(default=False)
@@ -20,12 +46,35 @@ class Page(models.Model):
         max_length=100, blank=True, null=True,
         help_text='Тип содержимого страницы: сертификат, титульный лист и т.п.'
     )
+    classification_source = models.CharField(
+        max_length=16, blank=True, choices=[(SOURCE_LLM, 'LLM'), (SOURCE_LOCAL, 'Локальный классификатор')],
+        help_text='Кто определил тип страницы'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     width = models.FloatField(null=True)
     height = models.FloatField(null=True)
+    search_vector = SearchVectorField(null=True, editable=False)  # raw_text + ocr_text, конфигурация russian
+    packed_blocks = models.BinaryField(
+        null=True, editable=False, help_text='Текстовые блоки страницы одним значением (см. documents.packed_blocks)'
+    )
+    materials_extracted_at = models.DateTimeField(
+        null=True, editable=False, help_text='Когда выполнено извлечение материалов (в том числе с пустым результатом)'
+    )
+    ocr_done_at = models.DateTimeField(
+        null=True, editable=False, help_text='Когда выполнен OCR страницы (в том числе с пустым результатом)'
+    )
 
     class Meta:
         unique_together = ('document', 'number')
+        indexes = [
+            GinIndex(fields=['search_vector'], name='page_search_vector_gin'),
+        ]
+
+    def get_blocks(self) -> Sequence:
+        """Текстовые блоки страницы: из упакованного значения или из строк TextBlock (учитывает prefetch_related)"""
+        if self.packed_blocks is not None:
+            return PackedBlocks(self.packed_blocks)
+        return self.blocks.all()
 
 
 class TextBlock(models.Model):
@@ -34,13 +83,83 @@ class TextBlock(models.Model):
     y0 = models.FloatField()
     x1 = models.FloatField()
     y1 = models.FloatField()
+    # Те же координаты в долях ширины и высоты страницы (0..1) — для поиска по относительной области
+    nx0 = models.FloatField(null=True, editable=False)
+    ny0 = models.FloatField(null=True, editable=False)
+    nx1 = models.FloatField(null=True, editable=False)
+    ny1 = models.FloatField(null=True, editable=False)
     text = models.TextField()
 
+    class Meta:
+        indexes = [
+            # Прямоугольник блока как box(point(x0, y0), point(x1, y1)) для пространственных запросов
+            GistIndex(
+                Func(Func(F('x0'), F('y0'), function='point'), Func(F('x1'), F('y1'), function='point'),
+                     function='box'),
+                name='textblock_box_gist',
+            ),
+            GistIndex(
+                Func(Func(F('nx0'), F('ny0'), function='point'), Func(F('nx1'), F('ny1'), function='point'),
+                     function='box'),
+                name='textblock_nbox_gist',
+            ),
+        ]
+
 
 class Material(models.Model):
     page = models.ForeignKey(Page, related_name='materials', on_delete=models.CASCADE)
     name = models.CharField(max_length=256)
     characteristics = models.JSONField(default=dict)  # например, {"ГОСТ": "1234-56", "Марка": "12Х18Н10Т"}
 
+    class Meta:
+        indexes = [
+            # jsonb_path_ops: компактный индекс для запросов вхождения characteristics @> {...}
+            GinIndex(fields=['characteristics'], opclasses=['jsonb_path_ops'], name='material_characteristics_gin'),
+        ]
+
     def __str__(self):
         return f"{self.name} ({self.page})"
+
+
+class UploadSession(models.Model):
+    """Загрузка файла по частям: части сохраняются в хранилище по мере поступления и собираются при завершении"""
+    STATUS_OPEN = 'open'
+    STATUS_ASSEMBLING = 'assembling'
+    STATUS_COMPLETE = 'complete'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_OPEN, 'Прием частей'),
+        (STATUS_ASSEMBLING, 'Сборка файла'),
+        (STATUS_COMPLETE, 'Завершена'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    original_filename = models.CharField(max_length=255)
+    total_size = models.PositiveBigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_OPEN)
+    error = models.TextField(blank=True)
+    document = models.ForeignKey(Document, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @property
+    def chunk_count(self) -> int:
+        return max(1, -(-self.total_size // self.chunk_size))
+
+    def expected_chunk_size(self, index: int) -> int:
+        """Размер части index: все части полные, кроме последней"""
+        if index < self.chunk_count - 1:
+            return self.chunk_size
+        return self.total_size - self.chunk_size * (self.chunk_count - 1)
+
+
+class UploadChunk(models.Model):
+    session = models.ForeignKey(UploadSession, on_delete=models.CASCADE, related_name='chunks')
+    index = models.PositiveIntegerField()
+    file = models.FileField(upload_to='uploads/chunks/')
+    size = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64)
+
+    class Meta:
+        unique_together = ('session', 'index')
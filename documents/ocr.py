@@ -0,0 +1,117 @@
+import fitz
+import logging
+import math
+import requests
+import threading
+
+from contextlib import contextmanager
+from django.utils import timezone
+
+from documents import metrics, raster_cache
+from documents.conf import (
+    MISTRAL_API_KEY, MISTRAL_OCR_URL, OCR_JPEG_QUALITY, OCR_MAX_DPI, OCR_MAX_PIXELS, OCR_MIN_DPI,
+    OCR_REQUEST_TIMEOUT)
+from documents.models import Page
+from documents.progress import publish_pages
+from documents.ratelimit import ProviderError, RateLimitedError, provider_call
+from documents.search import update_search_vectors
+
+
+# PyMuPDF не потокобезопасен, а задачи OCR выполняются в пуле потоков (очередь io): открытие,
+# закрытие PDF и рендер страниц сериализуются внутри процесса, запросы к OCR идут параллельно
+FITZ_LOCK = threading.RLock()
+
+
+@contextmanager
+def open_pdf(path: str):
+    with FITZ_LOCK:
+        pdf = fitz.open(path)
+    try:
+        yield pdf
+    finally:
+        with FITZ_LOCK:
+            pdf.close()
+
+
+def choose_render_params(page_obj) -> tuple[int, str]:
+    """DPI и формат изображения для OCR по размеру и содержимому страницы
+
+    DPI подбирается так, чтобы растр не превышал OCR_MAX_PIXELS: обычные листы рендерятся
+    с OCR_MAX_DPI, большие чертежи — с меньшим DPI. Страницы, почти целиком занятые
+    растровым изображением (фото скана), сжимаются в JPEG, векторные страницы — в PNG.
+    """
+    width_in, height_in = page_obj.rect.width / 72, page_obj.rect.height / 72
+    area_in = width_in * height_in
+    dpi = int(math.sqrt(OCR_MAX_PIXELS / area_in)) if area_in > 0 else OCR_MAX_DPI
+    dpi = max(OCR_MIN_DPI, min(OCR_MAX_DPI, dpi))
+
+    page_area = page_obj.rect.width * page_obj.rect.height
+    image_area = sum(fitz.Rect(info['bbox']).get_area() for info in page_obj.get_image_info())
+    image_format = 'jpeg' if page_area > 0 and image_area / page_area > 0.5 else 'png'
+    return dpi, image_format
+
+
+def render_page(page_obj, content_hash: str = '') -> tuple[bytes, str]:
+    """Рендер страницы в память в оттенках серого: (байты изображения, формат)
+
+    Для документа с известным content_hash растр берется из дискового кэша, если страница
+    уже рендерилась с теми же параметрами (повтор задачи, повторный OCR).
+    """
+    dpi, image_format = choose_render_params(page_obj)
+
+    def render() -> bytes:
+        pix = page_obj.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+        if image_format == 'jpeg':
+            return pix.tobytes('jpeg', jpg_quality=OCR_JPEG_QUALITY)
+        return pix.tobytes('png')
+
+    if not content_hash:
+        return render(), image_format
+    quality = OCR_JPEG_QUALITY if image_format == 'jpeg' else None
+    key = raster_cache.cache_key(content_hash, page_obj.number + 1, dpi, 'gray', image_format, quality)
+    return raster_cache.cached_render(key, render), image_format
+
+
+def recognize_image(session: requests.Session, image: bytes, image_format: str, name: str) -> str:
+    files = {"file": (f"{name}.{'jpg' if image_format == 'jpeg' else 'png'}", image, f"image/{image_format}")}
+    headers = {"Authorization": f"Bearer {MISTRAL_API_KEY}"}
+    response = provider_call('ocr', lambda: session.post(
+        MISTRAL_OCR_URL, headers=headers, files=files, timeout=OCR_REQUEST_TIMEOUT))
+    if response.status_code == 200:
+        return response.json().get("text", "")
+    raise ProviderError('OCR', response.status_code, response.text)
+
+
+def ocr_page(page: Page, pdf, session: requests.Session):
+    """OCR одной страницы открытого PDF через переданную HTTP-сессию"""
+    with metrics.timer('docscope_stage_seconds', stage='ocr_render'), FITZ_LOCK:
+        image, image_format = render_page(pdf[page.number - 1], page.document.content_hash)  # 1-based в модели
+    with metrics.timer('docscope_stage_seconds', stage='ocr_recognize'):
+        page.ocr_text = recognize_image(session, image, image_format, f"page-{page.number}")
+    # Отметка нужна и при пустом результате (скан без текста): такая страница не отправляется в OCR повторно
+    page.ocr_done_at = timezone.now()
+    with metrics.timer('docscope_stage_seconds', stage='db_write'):
+        page.save(update_fields=["ocr_text", "ocr_done_at"])
+        update_search_vectors(Page.objects.filter(id=page.id))
+    metrics.inc('docscope_pages_total', stage='ocr')
+    publish_pages(page.document_id, 'ocr', [page.number])
+
+
+def ocr_document_pages(document, pages) -> list[int]:
+    """OCR страниц документа: PDF открывается один раз, запросы идут через одну HTTP-сессию
+
+    Ошибка на странице не прерывает обработку остальных: страница остается без отметки ocr_done_at
+    и будет обработана при следующем запуске; результат — номера таких страниц. Перегрузка провайдера
+    (RateLimitedError) прерывает обработку: остальные страницы тоже получили бы отказ, задача повторяется позже.
+    """
+    failed = []
+    with open_pdf(document.file.path) as pdf, requests.Session() as session:
+        for page in pages:
+            try:
+                ocr_page(page, pdf, session)
+            except RateLimitedError:
+                raise
+            except Exception as e:
+                logging.warning(f'[ocr] Документ {document.id}, страница {page.number}: {e}')
+                failed.append(page.number)
+    return failed
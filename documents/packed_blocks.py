@@ -0,0 +1,77 @@
+import struct
+import sys
+
+from array import array
+from typing import Iterable, NamedTuple, Sequence
+
+# Компактное хранение текстовых блоков страницы одним значением (Page.packed_blocks) вместо строк TextBlock:
+#   заголовок: сигнатура b'TBP1' и число блоков n (uint32),
+#   координаты: 4 * n float32 (x0, y0, x1, y1 подряд),
+#   смещения: n + 1 uint32 — границы текстов блоков в UTF-8,
+#   тексты: UTF-8 всех блоков подряд.
+# Числа хранятся в little-endian. float32 дает точность около 1e-7 от значения (сотые доли пункта
+# даже на листах A0), чего достаточно для координат блоков.
+
+MAGIC = b'TBP1'
+HEADER = struct.Struct('<4sI')
+
+_SWAP = sys.byteorder == 'big'
+
+
+class PackedBlock(NamedTuple):
+    x0: float
+    y0: float
+    x1: float
+    y1: float
+    text: str
+
+
+def pack_blocks(blocks: Iterable) -> bytes:
+    """Упаковка блоков [x0, y0, x1, y1, text] (списки, кортежи или объекты TextBlock)"""
+    coords, offsets, texts = array('f'), array('I', [0]), []
+    for block in blocks:
+        if isinstance(block, (list, tuple)):
+            x0, y0, x1, y1, text = block
+        else:
+            x0, y0, x1, y1, text = block.x0, block.y0, block.x1, block.y1, block.text
+        coords.extend((x0, y0, x1, y1))
+        encoded = text.encode('utf-8')
+        texts.append(encoded)
+        offsets.append(offsets[-1] + len(encoded))
+    if _SWAP:
+        coords.byteswap()
+        offsets.byteswap()
+    return b''.join((HEADER.pack(MAGIC, len(texts)), coords.tobytes(), offsets.tobytes(), *texts))
+
+
+class PackedBlocks(Sequence):
+    """Блоки упакованного значения: массивы разбираются сразу, блоки и тексты — при обращении"""
+
+    def __init__(self, data: bytes):
+        data = memoryview(data)
+        magic, count = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError('Неизвестный формат упакованных блоков')
+        coords_end = HEADER.size + 16 * count
+        self.coords, self.offsets = array('f'), array('I')
+        self.coords.frombytes(data[HEADER.size:coords_end])
+        self.offsets.frombytes(data[coords_end:coords_end + 4 * (count + 1)])
+        if _SWAP:
+            self.coords.byteswap()
+            self.offsets.byteswap()
+        self.texts = data[coords_end + 4 * (count + 1):]
+        self.count = count
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.count))]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        x0, y0, x1, y1 = self.coords[4 * index:4 * index + 4]
+        text = str(self.texts[self.offsets[index]:self.offsets[index + 1]], 'utf-8')
+        return PackedBlock(x0, y0, x1, y1, text)
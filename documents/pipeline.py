@@ -0,0 +1,76 @@
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from documents.models import Document
+from documents.progress import publish_stage
+
+# Состояние конвейера обработки документа (разбор -> OCR -> классификация и извлечение материалов)
+# хранится в Document.pipeline_status: {этап: {status, started_at, finished_at, duration, error}}.
+
+STAGES = ('parse', 'ocr', 'classify', 'materials')
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+SKIPPED = 'skipped'    # этап не нужен: работа уже выполнена ранее
+FAILED = 'failed'
+
+FINISHED_STATUSES = {DONE, SKIPPED, FAILED}
+
+
+def _update_status(document_id: int, update):
+    """Изменение pipeline_status под блокировкой строки: этапы могут завершаться параллельно"""
+    with transaction.atomic():
+        document = Document.objects.select_for_update().only('id', 'pipeline_status').get(id=document_id)
+        update(document.pipeline_status)
+        document.save(update_fields=['pipeline_status'])
+
+
+def reset_pipeline(document_id: int):
+    def update(status):
+        status.clear()
+        status.update({stage: {'status': PENDING} for stage in STAGES})
+
+    _update_status(document_id, update)
+
+
+def set_stage_status(document_id: int, stage: str, stage_status: str, error: str = ''):
+    def update(status):
+        info = status.setdefault(stage, {})
+        now = timezone.now()
+        if stage_status == RUNNING:
+            info.clear()
+            info['started_at'] = now.isoformat()
+        elif stage_status in FINISHED_STATUSES:
+            info['finished_at'] = now.isoformat()
+            if started_at := info.get('started_at'):
+                info['duration'] = round((now - parse_datetime(started_at)).total_seconds(), 3)
+        info.pop('error', None)
+        if error:
+            info['error'] = error[:1000]
+        info['status'] = stage_status
+        published.update(info)
+
+    published = {}
+    _update_status(document_id, update)
+    publish_stage(document_id, stage, published)
+
+
+def fail_unfinished_stages(document_id: int, error: str):
+    """Пометка незавершенных этапов как неудачных (вызывается при ошибке задачи конвейера)"""
+    document = Document.objects.only('pipeline_status').get(id=document_id)
+    for stage, info in document.pipeline_status.items():
+        if info.get('status') == RUNNING:
+            set_stage_status(document_id, stage, FAILED, error)
+        elif info.get('status') == PENDING:
+            set_stage_status(document_id, stage, FAILED, 'Не выполнен из-за ошибки на предыдущем этапе')
+
+
+def is_pipeline_running(document: Document) -> bool:
+    return any(info.get('status') in (PENDING, RUNNING) for info in document.pipeline_status.values())
+
+
+def is_pipeline_finished(document: Document) -> bool:
+    """Все этапы выполнены или пропущены (документ без запусков конвейера тоже считается готовым)"""
+    return all(info.get('status') in (DONE, SKIPPED) for info in document.pipeline_status.values())
@@ -0,0 +1,144 @@
+import asyncio
+import json
+import logging
+import re
+
+from typing import Iterable, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Count, Q
+from django_redis import get_redis_connection
+
+from documents.models import Document
+
+# Ход обработки документа без опроса API: задачи Celery публикуют события в канал Redis pub/sub
+# документа, а ASGI-приложение (config/asgi.py) отдает их подписчикам как Server-Sent Events.
+# При подключении клиент сначала получает снимок состояния (один запрос к БД), затем только изменения:
+#   event: snapshot — page_count, parsed_pages, pipeline_status и счетчики страниц;
+#   event: progress — {"type": "pages", "stage": ..., "pages": [номера]} или {"type": "stage", ...}.
+
+CHANNEL_PREFIX = 'progress:document:'
+PATH_RE = re.compile(r'/events/documents/(?P<document_id>\d+)/?')
+
+# Комментарий SSE раз в KEEPALIVE секунд: прокси не закрывают соединение без событий
+KEEPALIVE = 15.0
+
+
+def channel(document_id: int) -> str:
+    return f'{CHANNEL_PREFIX}{document_id}'
+
+
+def _redis():
+    try:
+        return get_redis_connection('default')
+    except NotImplementedError:
+        return None
+
+
+def publish(document_id: int, event: dict):
+    """Публикация события документа (без Redis — ничего не делает)"""
+    if (redis := _redis()) is None:
+        return
+    try:
+        redis.publish(channel(document_id), json.dumps(event, ensure_ascii=False))
+    except Exception as e:
+        # Уведомления не должны ронять обработку документов
+        logging.warning(f'Не удалось опубликовать ход обработки документа {document_id}: {e}')
+
+
+def publish_pages(document_id: int, stage: str, numbers: Iterable[int], **extra):
+    """Страницы документа, обработанные на этапе stage (parse, ocr, classify, materials)"""
+    publish(document_id, {'type': 'pages', 'stage': stage, 'pages': sorted(numbers), **extra})
+
+
+def publish_stage(document_id: int, stage: str, info: dict):
+    publish(document_id, {'type': 'stage', 'stage': stage, **info})
+
+
+def get_snapshot(document_id: int) -> Optional[dict]:
+    document = Document.objects.filter(id=document_id).only('page_count', 'parsed_pages', 'pipeline_status').first()
+    if document is None:
+        return None
+    counts = document.pages.aggregate(
+        scanned=Count('id', filter=Q(is_scanned=True)),
+        ocr_done=Count('id', filter=Q(is_scanned=True, ocr_done_at__isnull=False)),
+        classified=Count('id', filter=Q(classification__isnull=False) & ~Q(classification='')),
+    )
+    return {
+        'type': 'snapshot',
+        'document': document.id,
+        'page_count': document.page_count,
+        'parsed_pages': document.parsed_pages,
+        'pipeline_status': document.pipeline_status,
+        'pages': counts,
+    }
+
+
+def _snapshot_and_close(document_id: int) -> Optional[dict]:
+    # Запрос идет мимо обработчика Django, поэтому соединения с БД закрываются здесь
+    try:
+        return get_snapshot(document_id)
+    finally:
+        close_old_connections()
+
+
+def _sse(event: str, data: str) -> bytes:
+    return f'event: {event}\ndata: {data}\n\n'.encode()
+
+
+async def _respond(send, status: int, body: bytes):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'text/plain; charset=utf-8')]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def progress_stream(scope, receive, send):
+    """ASGI-приложение: GET /events/documents/<id>/ — поток событий обработки документа"""
+    if scope['method'] != 'GET':
+        await _respond(send, 405, 'Метод не поддерживается'.encode())
+        return
+    document_id = int(PATH_RE.fullmatch(scope['path'])['document_id'])
+
+    # Подписка до чтения снимка: события между снимком и подпиской не теряются
+    pubsub = None
+    if _redis() is not None:
+        from redis.asyncio import Redis
+        redis = Redis.from_url(settings.CACHES['default']['LOCATION'])
+        pubsub = redis.pubsub()
+        await pubsub.subscribe(channel(document_id))
+    try:
+        snapshot = await sync_to_async(_snapshot_and_close)(document_id)
+        if snapshot is None:
+            await _respond(send, 404, 'Документ не найден'.encode())
+            return
+
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ]})
+        await send({'type': 'http.response.body', 'body': _sse('snapshot', json.dumps(snapshot, ensure_ascii=False)),
+                    'more_body': pubsub is not None})
+        if pubsub is None:
+            return
+
+        disconnected = asyncio.ensure_future(_wait_disconnect(receive))
+        try:
+            while not disconnected.done():
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=KEEPALIVE)
+                body = _sse('progress', message['data'].decode()) if message else b': keepalive\n\n'
+                await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+        finally:
+            disconnected.cancel()
+    finally:
+        if pubsub is not None:
+            await pubsub.unsubscribe()
+            await pubsub.aclose()
+            await redis.aclose()
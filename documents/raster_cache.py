@@ -0,0 +1,165 @@
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from typing import Callable, Optional
+
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django_redis import get_redis_connection
+
+from documents import metrics
+from documents.conf import RASTER_CACHE_DIR, RASTER_CACHE_MAX_BYTES
+from documents.models import Document
+
+# Дисковый кэш растров страниц для OCR: повторы задачи и повторный OCR документа не рендерят
+# страницы заново. Ключ — содержимое файла (content_hash), номер страницы, DPI, цветовое пространство
+# и формат изображения, поэтому документы-дубликаты используют общие растры. Объем ограничен
+# RASTER_CACHE_MAX_BYTES: индекс последнего обращения (sorted set в Redis) и общий счетчик байт
+# позволяют удалять давно не использованные файлы (LRU) из любого воркера.
+INDEX_KEY = 'raster_cache:index'
+SIZES_KEY = 'raster_cache:sizes'
+TOTAL_KEY = 'raster_cache:bytes'
+
+EXTENSIONS = {'jpeg': 'jpg', 'png': 'png'}
+
+
+def _redis():
+    try:
+        return get_redis_connection('default')
+    except NotImplementedError:
+        # Кэш Django не в Redis — LRU по времени изменения файлов
+        return None
+
+
+def cache_key(content_hash: str, number: int, dpi: int, colorspace: str, image_format: str,
+              quality: Optional[int] = None) -> str:
+    """Путь записи относительно RASTER_CACHE_DIR (number — номер страницы с 1, quality — качество JPEG)"""
+    suffix = f'-q{quality}' if quality is not None else ''
+    return f'{content_hash}/{number}-{dpi}-{colorspace}{suffix}.{EXTENSIONS[image_format]}'
+
+
+def get_raster(key: str) -> Optional[bytes]:
+    path = os.path.join(RASTER_CACHE_DIR, key)
+    try:
+        with open(path, 'rb') as f:
+            image = f.read()
+    except FileNotFoundError:
+        metrics.inc('docscope_raster_cache_requests_total', result='miss')
+        return None
+
+    metrics.inc('docscope_raster_cache_requests_total', result='hit')
+    if redis := _redis():
+        redis.zadd(INDEX_KEY, {key: time.time()})
+    else:
+        os.utime(path)
+    return image
+
+
+def put_raster(key: str, image: bytes):
+    path = os.path.join(RASTER_CACHE_DIR, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Запись через временный файл: параллельный воркер не прочитает недописанный растр
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(image)
+    os.replace(tmp_path, path)
+
+    if redis := _redis():
+        pipe = redis.pipeline()
+        pipe.zadd(INDEX_KEY, {key: time.time()})
+        pipe.hget(SIZES_KEY, key)
+        pipe.hset(SIZES_KEY, key, len(image))
+        _, previous, _ = pipe.execute()
+        total = redis.incrby(TOTAL_KEY, len(image) - int(previous or 0))
+        if total > RASTER_CACHE_MAX_BYTES:
+            _evict(redis, total - RASTER_CACHE_MAX_BYTES)
+    else:
+        _evict_by_mtime()
+
+
+def _remove_file(key: str):
+    try:
+        os.remove(os.path.join(RASTER_CACHE_DIR, key))
+    except FileNotFoundError:
+        pass
+
+
+def _evict(redis, excess: int):
+    """Удаление давно не использованных растров общим объемом не меньше excess байт"""
+    while excess > 0:
+        keys = [key.decode() for key in redis.zrange(INDEX_KEY, 0, 31)]
+        if not keys:
+            redis.set(TOTAL_KEY, 0)
+            return
+        sizes = redis.hmget(SIZES_KEY, keys)
+        evicted, freed = [], 0
+        for key, size in zip(keys, sizes):
+            if freed >= excess:
+                break
+            _remove_file(key)
+            evicted.append(key)
+            freed += int(size or 0)
+        _forget(redis, evicted, freed)
+        excess -= freed
+
+
+def _forget(redis, keys: list[str], freed: int):
+    pipe = redis.pipeline()
+    pipe.zrem(INDEX_KEY, *keys)
+    pipe.hdel(SIZES_KEY, *keys)
+    pipe.decrby(TOTAL_KEY, freed)
+    pipe.execute()
+
+
+def _evict_by_mtime():
+    entries = []
+    for root, _, files in os.walk(RASTER_CACHE_DIR):
+        for name in files:
+            stat = os.stat(os.path.join(root, name))
+            entries.append((stat.st_mtime, stat.st_size, os.path.join(root, name)))
+    excess = sum(size for _, size, _ in entries) - RASTER_CACHE_MAX_BYTES
+    for _, size, path in sorted(entries):
+        if excess <= 0:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        excess -= size
+
+
+def cached_render(key: str, render: Callable[[], bytes]) -> bytes:
+    """Растр из кэша или render() с сохранением в кэш (RASTER_CACHE_MAX_BYTES = 0 отключает кэш)"""
+    if not RASTER_CACHE_MAX_BYTES:
+        return render()
+    if (image := get_raster(key)) is not None:
+        return image
+
+    image = render()
+    try:
+        put_raster(key, image)
+    except OSError as e:
+        # Переполненный диск или права доступа не должны мешать OCR
+        logging.warning(f'Не удалось сохранить растр в кэш: {e}')
+    return image
+
+
+def delete_document_rasters(content_hash: str):
+    """Удаление всех растров файла с содержимым content_hash"""
+    directory = os.path.join(RASTER_CACHE_DIR, content_hash)
+    if redis := _redis():
+        keys = [key.decode() for key, _ in redis.zscan_iter(INDEX_KEY, match=f'{content_hash}/*')]
+        if keys:
+            sizes = redis.hmget(SIZES_KEY, keys)
+            _forget(redis, keys, sum(int(size or 0) for size in sizes))
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+@receiver(post_delete, sender=Document)
+def delete_rasters_of_deleted_document(sender, instance: Document, **kwargs):
+    # Растры общие для документов с одинаковым содержимым — удаляются вместе с последним из них
+    if instance.content_hash and not Document.objects.filter(content_hash=instance.content_hash).exists():
+        delete_document_rasters(instance.content_hash)
@@ -0,0 +1,268 @@
+import asyncio
+import random
+import time
+import uuid
+
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+from django_redis import get_redis_connection
+
+from documents import metrics
+from documents.conf import PROVIDER_BACKOFF_BASE, PROVIDER_LIMITS, PROVIDER_MAX_RETRIES, PROVIDER_MAX_RETRY_AFTER
+
+# Ограничение нагрузки на внешних провайдеров (OCR, LLM), общее для всех воркеров Celery:
+# - token bucket в Redis ограничивает частоту запросов (rate в секунду, burst);
+# - AIMD-лимит параллельных запросов: плавно растет при успешных ответах
+#   и уменьшается вдвое при перегрузке (429/503);
+# - повтор с экспоненциальной задержкой, учитывающий заголовок Retry-After (не дольше PROVIDER_MAX_RETRY_AFTER).
+
+RETRY_STATUSES = {429, 502, 503, 504}
+OVERLOAD_STATUSES = {429, 503}
+
+# Возвращает время ожидания в секундах (0 — токен получен)
+TOKEN_BUCKET_SCRIPT = '''
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+else
+  wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 60)
+return tostring(wait)
+'''
+
+# Занимает слот, если число активных запросов меньше текущего лимита; зависшие слоты истекают по ttl
+ACQUIRE_SLOT_SCRIPT = '''
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+local limit = tonumber(redis.call('GET', KEYS[2]) or ARGV[3])
+if redis.call('ZCARD', KEYS[1]) < math.max(1, math.floor(limit)) then
+  redis.call('ZADD', KEYS[1], now + tonumber(ARGV[2]), ARGV[1])
+  return 1
+end
+return 0
+'''
+
+# AIMD: ARGV[1] — 'increase' или 'decrease', ARGV[2] — минимум, ARGV[3] — максимум
+ADJUST_LIMIT_SCRIPT = '''
+local min_limit = tonumber(ARGV[2])
+local max_limit = tonumber(ARGV[3])
+local limit = tonumber(redis.call('GET', KEYS[1]) or max_limit)
+if ARGV[1] == 'increase' then
+  limit = math.min(max_limit, limit + 1 / math.max(1, limit))
+else
+  limit = math.max(min_limit, limit / 2)
+end
+redis.call('SET', KEYS[1], tostring(limit))
+return tostring(limit)
+'''
+
+
+class ProviderError(Exception):
+    """Ошибочный ответ внешнего провайдера"""
+
+    def __init__(self, provider: str, status_code: int, text: str = ''):
+        super().__init__(f'{provider} failed: {status_code} - {text[:500]}')
+        self.provider = provider
+        self.status_code = status_code
+
+
+class RateLimitedError(ProviderError):
+    """Провайдер перегружен, повторы исчерпаны"""
+
+
+def _redis():
+    try:
+        return get_redis_connection('default')
+    except NotImplementedError:
+        # Кэш не в Redis (локальная разработка) — ограничение отключено
+        return None
+
+
+def retry_after_seconds(response) -> Optional[float]:
+    """Значение заголовка Retry-After в секундах (число или HTTP-дата)"""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, response=None) -> float:
+    if response is not None and (delay := retry_after_seconds(response)) is not None:
+        return delay
+    return min(PROVIDER_BACKOFF_BASE * 2 ** attempt * random.uniform(0.5, 1.5), PROVIDER_MAX_RETRY_AFTER)
+
+
+def _retry_delay(provider: str, attempt: int, response) -> float:
+    """Пауза перед повтором; слишком долгое ожидание (Retry-After) — RateLimitedError"""
+    delay = backoff_delay(attempt, response)
+    if delay > PROVIDER_MAX_RETRY_AFTER:
+        metrics.inc('docscope_provider_errors_total', provider=provider, reason='rate_limited')
+        raise RateLimitedError(provider, response.status_code, f'Retry-After {delay:.0f} s: {response.text}')
+    return delay
+
+
+class ProviderLimiter:
+    """Распределенный ограничитель запросов к одному провайдеру"""
+
+    def __init__(self, provider: str):
+        self.provider = provider
+        self.config = PROVIDER_LIMITS[provider]
+        self.redis = _redis()
+        if self.redis is not None:
+            self._bucket = self.redis.register_script(TOKEN_BUCKET_SCRIPT)
+            self._acquire = self.redis.register_script(ACQUIRE_SLOT_SCRIPT)
+            self._adjust = self.redis.register_script(ADJUST_LIMIT_SCRIPT)
+
+    def _key(self, name: str) -> str:
+        return f'ratelimit:{self.provider}:{name}'
+
+    def token_wait(self) -> float:
+        """Секунды до появления токена (0 — токен получен)"""
+        if self.redis is None:
+            return 0.0
+        return float(self._bucket(keys=[self._key('bucket')], args=[self.config['rate'], self.config['burst']]))
+
+    def try_acquire_slot(self, slot_id: str) -> bool:
+        if self.redis is None:
+            return True
+        return bool(self._acquire(
+            keys=[self._key('slots'), self._key('limit')],
+            args=[slot_id, self.config['slot_timeout'], self.config['max_concurrency']],
+        ))
+
+    def release_slot(self, slot_id: str):
+        if self.redis is not None:
+            self.redis.zrem(self._key('slots'), slot_id)
+
+    def record(self, status_code: Optional[int]):
+        """Подстройка лимита параллельности по результату запроса"""
+        if self.redis is None:
+            return
+        if status_code in OVERLOAD_STATUSES:
+            direction = 'decrease'
+        elif status_code is not None and status_code < 400:
+            direction = 'increase'
+        else:
+            return
+        self._adjust(
+            keys=[self._key('limit')],
+            args=[direction, self.config['min_concurrency'], self.config['max_concurrency']],
+        )
+
+    @contextmanager
+    def slot(self):
+        """Ожидание токена и свободного слота на время одного запроса"""
+        slot_id = uuid.uuid4().hex
+        while (wait := self.token_wait()) > 0:
+            time.sleep(wait)
+        while not self.try_acquire_slot(slot_id):
+            time.sleep(random.uniform(0.05, 0.2))
+        try:
+            yield
+        finally:
+            self.release_slot(slot_id)
+
+    async def acquire_async(self) -> str:
+        # Запросы к Redis блокирующие — выполняются в потоке, чтобы не останавливать остальные корутины
+        slot_id = uuid.uuid4().hex
+        while (wait := await asyncio.to_thread(self.token_wait)) > 0:
+            await asyncio.sleep(wait)
+        while not await asyncio.to_thread(self.try_acquire_slot, slot_id):
+            await asyncio.sleep(random.uniform(0.05, 0.2))
+        return slot_id
+
+
+_limiters = {}
+
+
+def get_limiter(provider: str) -> ProviderLimiter:
+    if provider not in _limiters:
+        _limiters[provider] = ProviderLimiter(provider)
+    return _limiters[provider]
+
+
+def request_size(response) -> int:
+    """Размер тела отправленного запроса (requests или httpx)"""
+    request = getattr(response, 'request', None)
+    body = getattr(request, 'body', None) if request is not None else None
+    if body is None and request is not None and hasattr(request, 'content'):
+        try:
+            body = request.content
+        except Exception:
+            body = None
+    return len(body) if isinstance(body, (bytes, str)) else 0
+
+
+def record_response(provider: str, response, seconds: float, attempt: int):
+    metrics.observe('docscope_provider_request_seconds', seconds, provider=provider)
+    metrics.inc('docscope_provider_requests_total', provider=provider, status=response.status_code)
+    metrics.inc('docscope_provider_sent_bytes_total', request_size(response), provider=provider)
+    if attempt:
+        metrics.inc('docscope_provider_retries_total', provider=provider)
+
+
+def provider_call(provider: str, send, max_retries: int = PROVIDER_MAX_RETRIES):
+    """Вызов send() (HTTP-запрос requests/httpx) с ограничением нагрузки и повторами
+
+    Возвращает ответ провайдера; при перегрузке после всех повторов — RateLimitedError.
+    """
+    limiter = get_limiter(provider)
+    for attempt in range(max_retries + 1):
+        with limiter.slot():
+            started = time.perf_counter()
+            try:
+                response = send()
+            except Exception:
+                metrics.inc('docscope_provider_errors_total', provider=provider, reason='network')
+                raise
+        record_response(provider, response, time.perf_counter() - started, attempt)
+        limiter.record(response.status_code)
+        if response.status_code not in RETRY_STATUSES:
+            return response
+        if attempt < max_retries:
+            time.sleep(_retry_delay(provider, attempt, response))
+    metrics.inc('docscope_provider_errors_total', provider=provider, reason='rate_limited')
+    raise RateLimitedError(provider, response.status_code, response.text)
+
+
+async def aprovider_call(provider: str, asend, max_retries: int = PROVIDER_MAX_RETRIES):
+    """Асинхронный вариант provider_call для корутины asend()"""
+    limiter = get_limiter(provider)
+    for attempt in range(max_retries + 1):
+        slot_id = await limiter.acquire_async()
+        started = time.perf_counter()
+        try:
+            response = await asend()
+        except Exception:
+            metrics.inc('docscope_provider_errors_total', provider=provider, reason='network')
+            raise
+        finally:
+            await asyncio.to_thread(limiter.release_slot, slot_id)
+        record_response(provider, response, time.perf_counter() - started, attempt)
+        await asyncio.to_thread(limiter.record, response.status_code)
+        if response.status_code not in RETRY_STATUSES:
+            return response
+        if attempt < max_retries:
+            await asyncio.sleep(_retry_delay(provider, attempt, response))
+    metrics.inc('docscope_provider_errors_total', provider=provider, reason='rate_limited')
+    raise RateLimitedError(provider, response.status_code, response.text)
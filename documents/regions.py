@@ -0,0 +1,46 @@
+from typing import Optional
+
+from django.db.models import BooleanField, QuerySet
+from django.db.models.expressions import RawSQL
+
+from documents.models import TextBlock
+
+# Поиск текстовых блоков в прямоугольной области страницы (например, штамп в правом нижнем углу).
+# Условие записывается тем же выражением box(point(x0, y0), point(x1, y1)), что и GiST-индексы
+# textblock_box_gist и textblock_nbox_gist, поэтому PostgreSQL выбирает блоки по индексу, а не перебором таблицы.
+# Координаты — в пунктах PDF, начало в левом верхнем углу страницы (как у PyMuPDF); относительные
+# координаты (nx0..ny1) — доли ширины и высоты страницы, сохраняются вместе с блоком.
+
+BLOCK_BOX_SQL = 'box(point("documents_textblock"."x0", "documents_textblock"."y0"), ' \
+                'point("documents_textblock"."x1", "documents_textblock"."y1"))'
+NORMALIZED_BOX_SQL = 'box(point("documents_textblock"."nx0", "documents_textblock"."ny0"), ' \
+                     'point("documents_textblock"."nx1", "documents_textblock"."ny1"))'
+
+# intersects — блок пересекает область, within — блок целиком внутри области
+REGION_OPERATORS = {'intersects': '&&', 'within': '<@'}
+
+
+def region_condition(x0: float, y0: float, x1: float, y1: float, mode: str = 'intersects',
+                     relative: bool = False) -> RawSQL:
+    """Булево условие «блок попадает в прямоугольник» для filter()"""
+    box_sql = NORMALIZED_BOX_SQL if relative else BLOCK_BOX_SQL
+    return RawSQL(
+        f'{box_sql} {REGION_OPERATORS[mode]} box(point(%s, %s), point(%s, %s))',
+        (x0, y0, x1, y1), output_field=BooleanField(),
+    )
+
+
+def find_blocks_in_region(rect: tuple[float, float, float, float], relative: bool = False,
+                          mode: str = 'intersects', document_id: Optional[int] = None) -> QuerySet:
+    """Текстовые блоки в области rect = (x0, y0, x1, y1) по документу или по всему корпусу
+
+    При relative=True координаты — доли ширины и высоты страницы (0..1); условие строится по
+    нормализованному прямоугольнику блока, поэтому запрос один при любом числе форматов листа.
+    Блоки страниц без известного размера в относительный поиск не попадают.
+    """
+    if mode not in REGION_OPERATORS:
+        raise ValueError(f'Неизвестный режим поиска области: {mode}')
+    blocks = TextBlock.objects.all()
+    if document_id is not None:
+        blocks = blocks.filter(page__document_id=document_id)
+    return blocks.filter(region_condition(*rect, mode=mode, relative=relative))
@@ -0,0 +1,104 @@
+import re
+
+from dataclasses import dataclass
+from typing import Iterable
+
+# Признаки качества текста страницы для эвристик «скан/текст» и локального классификатора.
+# Классы символов считаются по байтам UTF-8: bytes.translate заменяет каждый байт кодом класса
+# (буква, цифра, спецсимвол), после чего коды подсчитываются bytes.count — все это циклы на C
+# без Python-итерации по символам. Латиница и основная кириллица (U+0400–U+047F, ведущие байты
+# D0 и D1 — только буквы) классифицируются таблицей, остальные символы — поштучно.
+
+_LETTER, _DIGIT, _SPECIAL, _RARE = 1, 2, 3, 4
+
+# Символы, характерные для мусора распознавания
+SPECIAL_CHARS = '|\\/[]'
+
+# Типичные ошибки OCR: частые замены букв, путаница цифр и букв, дублированные знаки
+OCR_ERROR_PATTERNS = ('vv', 'nn', 'rr', 'qq', '1i', 'l1', '0o', 'o0', ',,', '..', ';;')
+
+
+def _byte_class(byte: int) -> int:
+    if byte < 0x80:
+        char = chr(byte)
+        if char in SPECIAL_CHARS:
+            return _SPECIAL
+        if char.isalpha():
+            return _LETTER
+        if char.isdigit():
+            return _DIGIT
+        return 0
+    if byte < 0xC0:
+        return 0          # продолжение многобайтового символа
+    if byte in (0xD0, 0xD1):
+        return _LETTER    # кириллица U+0400–U+047F
+    return _RARE
+
+
+_BYTE_CLASSES = bytes(_byte_class(byte) for byte in range(256))
+_RARE_CHARS_RE = re.compile('[^\x00-\x7f\u0400-\u047f]')
+
+
+@dataclass(frozen=True)
+class TextFeatures:
+    chars: int
+    words: int
+    letters: int
+    digits: int
+    special_chars: int
+    ocr_errors: int
+
+    @property
+    def digit_letter_ratio(self) -> float:
+        return self.digits / self.letters if self.letters else 0.0
+
+    @property
+    def ocr_error_rate(self) -> float:
+        return self.ocr_errors / self.words if self.words else 0.0
+
+    @property
+    def looks_like_ocr_artifacts(self) -> bool:
+        """Признаки текста, полученного распознаванием скана"""
+        # Странные символы
+        if self.special_chars:
+            return True
+        # В сканах часто путают буквы и цифры
+        if self.digits and self.letters and self.digit_letter_ratio > 0.5:
+            return True
+        # Повторяющиеся ошибки распознавания
+        return self.ocr_errors > self.words // 10
+
+    def as_vector(self) -> tuple[float, ...]:
+        """Числовой вектор признаков для классификаторов"""
+        return (
+            float(self.chars), float(self.words), float(self.letters), float(self.digits),
+            float(self.special_chars), float(self.ocr_errors), self.digit_letter_ratio, self.ocr_error_rate,
+        )
+
+
+def count_ocr_errors(text: str) -> int:
+    return sum(map(text.count, OCR_ERROR_PATTERNS))
+
+
+def score_text(text: str) -> TextFeatures:
+    classes = text.encode('utf-8', 'surrogatepass').translate(_BYTE_CLASSES)
+    letters = classes.count(_LETTER)
+    digits = classes.count(_DIGIT)
+    if classes.count(_RARE):
+        # Символы вне таблицы (диакритика, греческий, CJK и т.п.) — обычно их нет или единицы
+        rare = _RARE_CHARS_RE.findall(text)
+        letters += sum(map(str.isalpha, rare))
+        digits += sum(map(str.isdigit, rare))
+    return TextFeatures(
+        chars=len(text),
+        words=len(text.split()),
+        letters=letters,
+        digits=digits,
+        special_chars=classes.count(_SPECIAL),
+        ocr_errors=count_ocr_errors(text),
+    )
+
+
+def score_texts(texts: Iterable[str]) -> list[TextFeatures]:
+    """Признаки для пачки страниц (например, для эвристик и классификатора по одной выборке)"""
+    return [score_text(text) for text in texts]
@@ -0,0 +1,42 @@
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank, SearchVector
+from django.db.models import F, Value
+from django.db.models.functions import Concat
+
+from documents.models import Page
+
+# Полнотекстовый поиск по страницам: tsvector из текста PDF (вес A) и текста OCR (вес B)
+# с русской конфигурацией, хранится в Page.search_vector под GIN-индексом.
+SEARCH_CONFIG = 'russian'
+
+
+def page_search_vector():
+    return (
+        SearchVector('raw_text', config=SEARCH_CONFIG, weight='A')
+        + SearchVector('ocr_text', config=SEARCH_CONFIG, weight='B')
+    )
+
+
+def update_search_vectors(pages):
+    """Пересчет search_vector для набора страниц одним UPDATE"""
+    pages.update(search_vector=page_search_vector())
+
+
+def search_pages(query: str, document_id=None):
+    """Страницы, найденные по запросу (синтаксис websearch), по убыванию релевантности, со сниппетами"""
+    search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+    pages = Page.objects.filter(search_vector=search_query)
+    if document_id is not None:
+        pages = pages.filter(document_id=document_id)
+    return (
+        pages
+        .annotate(
+            rank=SearchRank(F('search_vector'), search_query),
+            snippet=SearchHeadline(
+                Concat('raw_text', Value('\n'), 'ocr_text'), search_query, config=SEARCH_CONFIG,
+                start_sel='<b>', stop_sel='</b>', max_fragments=3,
+            ),
+        )
+        .select_related('document')
+        .only('id', 'number', 'classification', 'document_id', 'document__original_filename')
+        .order_by('-rank', 'id')
+    )
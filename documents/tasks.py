@@ -1,88 +1,336 @@
 import fitz
-import requests
-import tempfile
+import logging
 
-from celery import shared_task
+from celery import chain, chord, group, shared_task
+from celery.exceptions import SoftTimeLimitExceeded
+from django.db.models import Q
 
-from documents.conf import MISTRAL_API_KEY, MISTRAL_OCR_URL
-from documents.llm import classify_text_with_llm, extract_materials_from_text
-from documents.models import Document, Page, Material
-from documents.utils import process_pdf, process_document_pages
+from documents import metrics, pipeline
+from documents.conf import (
+    LLM_CLASSIFY_BATCH_TOKENS, LLM_CONCURRENCY, LLM_SAVE_BATCH_SIZE, LOCAL_CLASSIFIER_THRESHOLD,
+    PDF_DUPLICATE_MAX_WAITS, PDF_DUPLICATE_WAIT, PDF_PARSE_MAX_RETRIES, PDF_PARSE_SOFT_TIME_LIMIT, PDF_SHARD_SIZE,
+    PDF_SHARD_MAX_PARALLEL, PIPELINE_OCR_PAGES_PER_TASK)
+from documents.llm import (
+    CLASSIFY_ERROR_LABEL, aclassify_text_with_llm, aextract_materials_from_text, classify_text_with_llm,
+    classify_texts_concurrently, classify_texts_with_llm, extract_materials_from_text)
+from documents.models import Document, Page, UploadSession
+from documents.ocr import ocr_document_pages
+from documents.pipeline import fail_unfinished_stages, reset_pipeline, set_stage_status
+from documents.progress import publish_pages
+from documents.ratelimit import RateLimitedError
+from documents.utils import (
+    classify_pages_locally, clone_document_content, find_parsed_duplicate, has_duplicate_in_progress, iter_batches,
+    process_pdf, process_pdf_shard, process_document_pages, process_document_pages_async, replace_page_materials,
+    set_page_count, split_page_ranges)
+from documents.uploads import assemble_upload
+
+
+# Задачи разбора: при гибели процесса воркера задача возвращается в очередь (acks_late и reject_on_worker_lost),
+# при превышении мягкого лимита времени — перезапускается через retry (по жесткому лимиту Celery подтверждает
+# задачу без повтора). В обоих случаях разбор продолжается с последней сохраненной страницы.
+
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True,
+             soft_time_limit=PDF_PARSE_SOFT_TIME_LIMIT, max_retries=PDF_PARSE_MAX_RETRIES)
+def parse_pdf_task(self, document_id, waits=0):
+    doc = Document.objects.get(id=document_id)
+    if should_wait_for_duplicate(doc, waits):
+        return self.replace(self.si(document_id, waits=waits + 1).set(countdown=PDF_DUPLICATE_WAIT))
+    try:
+        workflow = parse_document(doc)
+    except SoftTimeLimitExceeded as e:
+        raise self.retry(exc=e, countdown=0)
+    if workflow:
+        workflow.delay()
+
+
+def should_wait_for_duplicate(doc, waits: int) -> bool:
+    """Разбор откладывается, пока документ с тем же содержимым еще обрабатывается (потом результат копируется)
+
+    Задача заменяется своей копией с задержкой PDF_DUPLICATE_WAIT, так что цепочка конвейера сохраняется;
+    после PDF_DUPLICATE_MAX_WAITS откладываний документ разбирается сам.
+    """
+    return waits < PDF_DUPLICATE_MAX_WAITS and not find_parsed_duplicate(doc) and has_duplicate_in_progress(doc)
+
+
+def parse_document(doc):
+    """Разбор PDF; для большого документа возвращает chord параллельного разбора шардов
+
+    Короткий документ (или копия уже разобранного) обрабатывается сразу, и результат — None.
+    """
+    # Тот же файл уже обработан — копируем результаты без извлечения текста, OCR и LLM
+    if source := find_parsed_duplicate(doc):
+        clone_document_content(source, doc)
+        return None
+
+    with fitz.open(doc.file.path) as pdf:
+        set_page_count(doc, len(pdf))
+
+    ranges = split_page_ranges(doc.page_count, PDF_SHARD_SIZE, PDF_SHARD_MAX_PARALLEL, start=doc.parsed_pages)
+    if len(ranges) < 2:
+        process_pdf(doc)
+        return None
+
+    # Шарды разбираются и сохраняют свои страницы параллельно, контрольная точка — после всех шардов
+    return chord(
+        [parse_pdf_shard_task.s(doc.id, start, stop) for start, stop in ranges],
+        finish_pdf_shards_task.s(doc.id)
+    )
+
+
+@shared_task(acks_late=True, reject_on_worker_lost=True)
+def finalize_upload_task(session_id):
+    """Сборка загруженных частей в документ и запуск разбора"""
+    session = UploadSession.objects.get(id=session_id)
+    if session.status != UploadSession.STATUS_ASSEMBLING:
+        return
+    try:
+        document = assemble_upload(session)
+    except Exception as e:
+        UploadSession.objects.filter(id=session_id).update(status=UploadSession.STATUS_FAILED, error=str(e))
+        raise
+    parse_pdf_task.delay(document.id)
+
+
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True,
+             soft_time_limit=PDF_PARSE_SOFT_TIME_LIMIT, max_retries=PDF_PARSE_MAX_RETRIES)
+def parse_pdf_shard_task(self, document_id, start, stop):
+    # Через бэкенд результатов передается только число страниц, а не их текст и блоки
+    try:
+        return process_pdf_shard(Document.objects.get(id=document_id), start, stop)
+    except SoftTimeLimitExceeded as e:
+        raise self.retry(exc=e, countdown=0)
 
 
 @shared_task
-def parse_pdf_task(document_id):
+def finish_pdf_shards_task(shard_counts, document_id):
     doc = Document.objects.get(id=document_id)
-    process_pdf(doc)
+    saved = doc.pages.count()
+    if saved < doc.page_count:
+        raise RuntimeError(f'Документ {document_id}: сохранено {saved} из {doc.page_count} страниц')
+    Document.objects.filter(id=document_id).update(parsed_pages=doc.page_count)
+
+
+def pages_to_ocr(document):
+    return document.pages.filter(is_scanned=True, ocr_done_at__isnull=True).order_by("number")
+
+
+def ocr_page_batches(document) -> list[list[int]]:
+    """id страниц для OCR, разбитые на задачи по PIPELINE_OCR_PAGES_PER_TASK страниц"""
+    page_ids = pages_to_ocr(document).values_list("id", flat=True)
+    return list(iter_batches(page_ids, PIPELINE_OCR_PAGES_PER_TASK))
 
 
 @shared_task
 def run_ocr_for_document(document_id):
+    """OCR сканированных страниц документа параллельными задачами (каждая ограничена своим числом страниц)"""
     doc = Document.objects.get(id=document_id)
-    scanned_pages = doc.pages.filter(is_scanned=True, ocr_text="")
-    for page in scanned_pages:
-        run_ocr_for_page.delay(page.id)
+    if batches := ocr_page_batches(doc):
+        group(run_ocr_for_pages.si(document_id, batch) for batch in batches).delay()
+
+
+# Повтор задачи OCR с нарастающей задержкой при перегрузке провайдера: уже распознанные страницы
+# при повторе пропускаются
+@shared_task(autoretry_for=(RateLimitedError,), retry_backoff=True, retry_backoff_max=600, max_retries=5)
+def run_ocr_for_pages(document_id, page_ids):
+    """OCR части страниц документа; результат — номера страниц с ошибкой"""
+    doc = Document.objects.get(id=document_id)
+    return ocr_document_pages(doc, pages_to_ocr(doc).filter(id__in=page_ids))
 
 
 @shared_task
 def run_ocr_for_page(page_id):
-    page = Page.objects.select_related('document').get(id=page_id)
-    if not page.is_scanned:
-        return
-    doc_path = page.document.file.path
-    page_number = page.number - 1  # 1-based в модели
-    pdf = fitz.open(doc_path)
-    pdf_page = pdf[page_number]
-    pix = pdf_page.get_pixmap(dpi=300)
-    with tempfile.NamedTemporaryFile(suffix=".png") as temp_image:
-        pix.save(temp_image.name)
-        with open(temp_image.name, "rb") as image_file:
-            files = {"file": image_file}
-            headers = {"Authorization": f"Bearer {MISTRAL_API_KEY}"}
-            response = requests.post(MISTRAL_OCR_URL, headers=headers, files=files)
-        if response.status_code == 200:
-            ocr_text = response.json().get("text", "")
-            page.ocr_text = ocr_text
-            page.save()
-        else:
-            raise Exception(f"OCR failed: {response.status_code} - {response.text}")
+    """OCR одной страницы (сохранена для уже поставленных в очередь задач и внешних вызовов)"""
+    page = Page.objects.only('document_id').get(id=page_id)
+    run_ocr_for_pages.delay(page.document_id, [page_id])
+
+
+def pages_to_classify(document, only_missing: bool = False):
+    pages = document.pages.exclude(raw_text='', ocr_text='').order_by('number')
+    if only_missing:
+        pages = pages.filter(
+            Q(classification__isnull=True) | Q(classification='') | Q(classification=CLASSIFY_ERROR_LABEL))
+    return pages
+
+
+def pages_to_extract_materials(document, only_missing: bool = False):
+    pages = document.pages.exclude(raw_text='', ocr_text='').order_by('number')
+    return pages.filter(materials_extracted_at__isnull=True) if only_missing else pages
 
 
 @shared_task
-def classify_document_pages(document_id):
+def classify_document_pages(document_id, only_missing=False):
+    """Классификация страниц; only_missing — только страницы без классификации"""
     try:
         document = Document.objects.get(id=document_id)
+        pages = pages_to_classify(document, only_missing)
 
-        def classify(text):
-            return classify_text_with_llm(text)
+        # Сначала локальный классификатор, в LLM уходят только неуверенно размеченные страницы
+        if LOCAL_CLASSIFIER_THRESHOLD <= 1:
+            uncertain_ids = []
+            pages_with_blocks = pages.prefetch_related('blocks').iterator(chunk_size=LLM_SAVE_BATCH_SIZE)
+            for batch in iter_batches(pages_with_blocks, LLM_SAVE_BATCH_SIZE):
+                uncertain_ids.extend(page.id for page in classify_pages_locally(batch))
+            pages = pages.filter(id__in=uncertain_ids)
 
-        def save(page, label):
-            page.classification = label or "Неизвестно"
-            page.save(update_fields=["classification"])
-
-        process_document_pages(document, classify, save, description="classify")
+        classify_pages_with_llm(document, pages)
 
     except Document.DoesNotExist:
         print(f"[classify] Документ {document_id} не найден")
 
 
+def classify_pages_with_llm(document, pages):
+    def apply(page, label):
+        page.classification = label or "Неизвестно"
+        page.classification_source = Page.SOURCE_LLM
+
+    if LLM_CLASSIFY_BATCH_TOKENS > 0:
+        # Несколько страниц в одном запросе в пределах бюджета токенов; при LLM_CONCURRENCY > 1
+        # пакеты отправляются одновременно
+        classify_texts = classify_texts_concurrently if LLM_CONCURRENCY > 1 else classify_texts_with_llm
+        for batch in iter_batches(pages.iterator(chunk_size=LLM_SAVE_BATCH_SIZE), LLM_SAVE_BATCH_SIZE):
+            with metrics.timer('docscope_stage_seconds', stage='classify_batch'):
+                labels = classify_texts([page.raw_text or page.ocr_text for page in batch])
+            metrics.inc('docscope_pages_total', len(batch), stage='classify')
+            for page, label in zip(batch, labels):
+                apply(page, label)
+            Page.objects.bulk_update(batch, ["classification", "classification_source"])
+            publish_pages(document.id, 'classify', [page.number for page in batch])
+        return
+
+    if LLM_CONCURRENCY > 1:
+        def save_all(results):
+            for page, label in results:
+                apply(page, label)
+            Page.objects.bulk_update([page for page, _ in results], ["classification", "classification_source"])
+
+        process_document_pages_async(
+            document, aclassify_text_with_llm, save_all, description="classify", pages=pages)
+        return
+
+    def classify(text):
+        return classify_text_with_llm(text)
+
+    def save(page, label):
+        apply(page, label)
+        page.save(update_fields=["classification", "classification_source"])
+
+    process_document_pages(document, classify, save, description="classify", pages=pages)
+
+
 @shared_task
-def extract_materials_from_document(document_id):
+def extract_materials_from_document(document_id, only_missing=False):
+    """Извлечение материалов; only_missing — только страницы, для которых извлечение еще не выполнялось"""
     try:
         document = Document.objects.get(id=document_id)
+        pages = pages_to_extract_materials(document, only_missing)
+
+        if LLM_CONCURRENCY > 1:
+            process_document_pages_async(
+                document, aextract_materials_from_text, replace_page_materials, description="materials", pages=pages)
+            return
 
         def extract(text):
             return extract_materials_from_text(text)
 
         def save(page, materials):
-            for mat in materials:
-                Material.objects.create(
-                    page=page,
-                    name=mat.get('name', 'Неизвестно'),
-                    characteristics=mat.get('characteristics', {})
-                )
+            replace_page_materials([(page, materials)])
 
-        process_document_pages(document, extract, save, description="materials")
+        process_document_pages(document, extract, save, description="materials", pages=pages)
 
     except Document.DoesNotExist:
         print(f"[materials] Документ {document_id} не найден")
+
+
+# Конвейер: разбор -> параллельный OCR -> классификация и извлечение материалов (параллельно).
+# Этапы разбора и OCR заменяют себя (Task.replace) на chord параллельных задач, поэтому следующий
+# этап цепочки стартует сразу после завершения последней из них. Уже выполненная работа
+# (разобранные страницы, распознанный текст, классификации, материалы) не повторяется.
+
+def start_pipeline(document_id):
+    reset_pipeline(document_id)
+    workflow = chain(
+        pipeline_parse_task.si(document_id),
+        pipeline_ocr_task.si(document_id),
+        group(pipeline_classify_task.si(document_id), pipeline_materials_task.si(document_id)),
+    )
+    workflow.on_error(pipeline_failed.s(document_id))
+    return workflow.delay()
+
+
+@shared_task
+def pipeline_stage_done(document_id, stage):
+    set_stage_status(document_id, stage, pipeline.DONE)
+
+
+@shared_task
+def pipeline_ocr_done(failed_pages, document_id):
+    """Завершение этапа OCR: ошибки отдельных страниц не прерывают конвейер, но этап считается неудачным"""
+    failed = sorted(number for numbers in failed_pages for number in numbers or ())
+    if failed:
+        set_stage_status(document_id, 'ocr', pipeline.FAILED,
+                         f'OCR не выполнен для страниц: {", ".join(map(str, failed))}')
+    else:
+        set_stage_status(document_id, 'ocr', pipeline.DONE)
+
+
+@shared_task
+def pipeline_failed(request, exc, traceback, document_id):
+    logging.error(f'[pipeline] Документ {document_id}: ошибка в задаче {request.id}: {exc}')
+    fail_unfinished_stages(document_id, str(exc))
+
+
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True,
+             soft_time_limit=PDF_PARSE_SOFT_TIME_LIMIT, max_retries=PDF_PARSE_MAX_RETRIES)
+def pipeline_parse_task(self, document_id, waits=0):
+    doc = Document.objects.get(id=document_id)
+    if doc.is_parsed:
+        set_stage_status(document_id, 'parse', pipeline.SKIPPED)
+        return
+    if should_wait_for_duplicate(doc, waits):
+        return self.replace(self.si(document_id, waits=waits + 1).set(countdown=PDF_DUPLICATE_WAIT))
+
+    set_stage_status(document_id, 'parse', pipeline.RUNNING)
+    try:
+        workflow = parse_document(doc)
+    except SoftTimeLimitExceeded as e:
+        raise self.retry(exc=e, countdown=0)
+    if workflow:
+        return self.replace(workflow | pipeline_stage_done.si(document_id, 'parse'))
+    set_stage_status(document_id, 'parse', pipeline.DONE)
+
+
+@shared_task(bind=True)
+def pipeline_ocr_task(self, document_id):
+    batches = ocr_page_batches(Document.objects.get(id=document_id))
+    if not batches:
+        set_stage_status(document_id, 'ocr', pipeline.SKIPPED)
+        return
+
+    set_stage_status(document_id, 'ocr', pipeline.RUNNING)
+    return self.replace(chord(
+        [run_ocr_for_pages.si(document_id, batch) for batch in batches],
+        pipeline_ocr_done.s(document_id),
+    ))
+
+
+def _run_llm_stage(document_id, stage, pages, run):
+    if not pages.exists():
+        set_stage_status(document_id, stage, pipeline.SKIPPED)
+        return
+    set_stage_status(document_id, stage, pipeline.RUNNING)
+    run()
+    set_stage_status(document_id, stage, pipeline.DONE)
+
+
+@shared_task
+def pipeline_classify_task(document_id):
+    doc = Document.objects.get(id=document_id)
+    _run_llm_stage(document_id, 'classify', pages_to_classify(doc, only_missing=True),
+                   lambda: classify_document_pages(document_id, only_missing=True))
+
+
+@shared_task
+def pipeline_materials_task(document_id):
+    doc = Document.objects.get(id=document_id)
+    _run_llm_stage(document_id, 'materials', pages_to_extract_materials(doc, only_missing=True),
+                   lambda: extract_materials_from_document(document_id, only_missing=True))
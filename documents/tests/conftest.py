@@ -0,0 +1,38 @@
+import pytest
+
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+from documents.benchmarks.corpus import CorpusSpec, generate_pdf
+from documents.models import Document
+
+# Тесты запускаются с настройками проекта (PostgreSQL и Redis из docker-compose):
+#   docker compose run --rm web pytest documents/tests
+# Тесты Lua-скриптов ограничителя без доступного Redis пропускаются.
+
+
+@pytest.fixture
+def media_root(settings, tmp_path):
+    """Файлы документов и частей загрузки — во временном каталоге"""
+    settings.MEDIA_ROOT = str(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def make_document(media_root):
+    """Документ с синтетическим PDF из pages текстовых страниц"""
+    def make(pages: int, **fields) -> Document:
+        generate_pdf(str(media_root / 'doc.pdf'), CorpusSpec(pages=pages, lines_per_page=3))
+        return Document.objects.create(file='doc.pdf', original_filename='doc.pdf', **fields)
+
+    return make
+
+
+@pytest.fixture
+def redis():
+    try:
+        connection = get_redis_connection('default')
+        connection.ping()
+    except (NotImplementedError, RedisError):
+        pytest.skip('Redis недоступен')
+    return connection
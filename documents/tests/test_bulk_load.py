@@ -0,0 +1,82 @@
+import csv
+import io
+
+from datetime import datetime, timezone
+
+import pytest
+
+from psycopg2 import Binary
+from psycopg2.extras import Json
+
+from documents.bulk_load import NULL, CsvRowsReader, _csv_value, copy_insert
+from documents.models import Document, Material, Page, TextBlock
+from documents.packed_blocks import pack_blocks
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('текст', '"текст"'),
+    ('', '""'),
+    ('a "b", c', '"a ""b"", c"'),
+    ('строка\nвторая', '"строка\nвторая"'),
+    ('\\N', '"\\N"'),
+    (None, NULL),
+    (True, 't'),
+    (False, 'f'),
+    (42, '42'),
+    (0.1, '0.1'),
+    (Json({'grade': '12"X'}), '"{""grade"": ""12\\""X""}"'),
+    (Binary(b'\x00\xff'), '\\x00ff'),
+    (datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc), '"2024-01-02 03:04:05+00:00"'),
+])
+def test_csv_value(value, expected):
+    assert _csv_value(value) == expected
+
+
+def test_null_and_empty_string_are_distinct():
+    # NULL без кавычек, пустая строка и текст «\N» — в кавычках
+    row = ','.join(map(_csv_value, [None, '', '\\N']))
+    assert next(csv.reader(io.StringIO(row))) == ['\\N', '', '\\N']
+    assert row == '\\N,"","\\N"'
+
+
+@pytest.mark.parametrize('size', [1, 3, 7, -1])
+def test_rows_reader_returns_all_rows_for_any_read_size(size):
+    rows = [f'{index},"строка {index}"\n' for index in range(100)]
+    reader = CsvRowsReader(iter(rows))
+    parts = []
+    while data := reader.read(size):
+        assert size < 0 or len(data) <= size
+        parts.append(data)
+    assert ''.join(parts) == ''.join(rows)
+
+
+@pytest.mark.django_db
+def test_copy_insert_round_trip():
+    document = Document.objects.create(file='doc.pdf', original_filename='doc.pdf')
+    texts = ['', 'a "b", c', 'строка\nвторая', '\\N', 'обычный текст']
+    blocks = [[1.5, 2.0, 3.25, 4.0, 'блок']]
+    pages = copy_insert(Page, [
+        Page(document=document, number=number, raw_text=text, width=None if number == 1 else 595.5,
+             packed_blocks=pack_blocks(blocks))
+        for number, text in enumerate(texts, start=1)
+    ])
+
+    # Ключи зарезервированы и проставлены объектам
+    assert all(page.pk for page in pages)
+    saved = {page.pk: page for page in Page.objects.filter(document=document)}
+    assert set(saved) == {page.pk for page in pages}
+    for page, text in zip(pages, texts):
+        assert saved[page.pk].raw_text == text
+        assert bytes(saved[page.pk].packed_blocks) == pack_blocks(blocks)
+        assert saved[page.pk].created_at is not None  # auto_now_add через pre_save
+    assert saved[pages[0].pk].width is None
+    assert saved[pages[1].pk].width == 595.5
+
+    copy_insert(TextBlock, [
+        TextBlock(page=pages[0], x0=0, y0=0, x1=1, y1=1, text=text) for text in texts
+    ], set_pks=False)
+    assert list(TextBlock.objects.filter(page=pages[0]).order_by('id').values_list('text', flat=True)) == texts
+
+    characteristics = {'ГОСТ': '5632-72', 'Марка': '12Х18Н10Т "нерж."', 'Примечание': None}
+    copy_insert(Material, [Material(page=pages[0], name='Сталь', characteristics=characteristics)], set_pks=False)
+    assert Material.objects.get(page=pages[0]).characteristics == characteristics
@@ -0,0 +1,68 @@
+import pytest
+
+from documents import llm
+from documents.llm import (
+    CLASSIFY_ERROR_LABEL, CLASSIFY_LABELS, classify_batch_max_tokens, classify_texts_with_llm, estimate_tokens,
+    normalize_classify_label, parse_classify_batch_response)
+
+
+@pytest.fixture
+def local_cache(settings):
+    settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def test_batch_response_json_with_surrounding_text():
+    response = 'Ответ:\n{"1": "сертификат", "2": "титульный лист", "3": "другое"}\nГотово.'
+    assert parse_classify_batch_response(response, 3) == {1: 'сертификат', 2: 'титульный лист', 3: 'другое'}
+
+
+def test_batch_response_truncated_json_keeps_complete_pairs():
+    # Ответ обрезан по max_tokens посреди третьей пары
+    response = '{"1": "сертификат", "2": "пустая", "3": "техническая харак'
+    assert parse_classify_batch_response(response, 3) == {1: 'сертификат', 2: 'пустая'}
+
+
+def test_batch_response_broken_json_keeps_complete_pairs():
+    response = '{"1": "Сертификат.", "2" "другое", "3": "скан без текста",}'
+    assert parse_classify_batch_response(response, 3) == {1: 'сертификат', 3: 'скан без текста'}
+
+
+def test_batch_response_drops_unknown_labels_and_numbers():
+    response = '{"1": "чертеж", "2": 5, "3": " Другое ", "4": "сертификат", "0": "пустая"}'
+    assert parse_classify_batch_response(response, 3) == {3: 'другое'}
+
+
+@pytest.mark.parametrize('response', ['', 'не знаю', '[]', '["сертификат"]', '{}'])
+def test_batch_response_without_answers(response):
+    assert parse_classify_batch_response(response, 2) == {}
+
+
+@pytest.mark.parametrize('label, expected', [
+    ('Титульный лист.', 'титульный лист'),
+    ('  пустая \n', 'пустая'),
+    ('похоже на сертификат', None),
+    ('', None),
+    (None, None),
+    (['другое'], None),
+])
+def test_normalize_classify_label(label, expected):
+    assert normalize_classify_label(label) == expected
+
+
+def test_batch_max_tokens_fits_longest_answer():
+    count = 25
+    answer = '{' + ', '.join(f'"{number}": "{max(CLASSIFY_LABELS, key=len)}"' for number in range(1, count + 1)) + '}'
+    assert classify_batch_max_tokens(count) >= estimate_tokens(answer)
+
+
+def test_batch_fallback_only_for_pages_missing_in_response(local_cache, monkeypatch):
+    texts = [f'страница {number}' for number in range(4)]
+    answers = iter([None, {1: 'сертификат'}])
+    single = []
+    monkeypatch.setattr(llm, '_request_classification_batch', lambda batch: next(answers))
+    monkeypatch.setattr(llm, '_request_classification', lambda text: single.append(text) or 'другое')
+    monkeypatch.setattr(llm, 'pack_classify_batches', lambda batch, budget: [[0, 1], [2, 3]])
+
+    # Первый пакет не выполнен — ошибка без повторов по одной странице; во втором нет ответа для страницы 3
+    assert classify_texts_with_llm(texts) == [CLASSIFY_ERROR_LABEL, CLASSIFY_ERROR_LABEL, 'сертификат', 'другое']
+    assert single == ['страница 3']
@@ -0,0 +1,142 @@
+import time
+
+from email.utils import formatdate
+from types import SimpleNamespace
+
+import pytest
+
+from documents import ratelimit
+from documents.conf import PROVIDER_LIMITS, PROVIDER_MAX_RETRY_AFTER
+from documents.ratelimit import (
+    ProviderLimiter, RateLimitedError, backoff_delay, provider_call, retry_after_seconds)
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, headers: dict = None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.text = ''
+        self.request = None
+
+
+@pytest.fixture
+def limiter(redis, monkeypatch):
+    """Ограничитель тестового провайдера: 10 запросов в секунду, burst 3, до 2 параллельных запросов"""
+    monkeypatch.setitem(PROVIDER_LIMITS, 'test', {
+        'rate': 10.0, 'burst': 3, 'min_concurrency': 1, 'max_concurrency': 2, 'slot_timeout': 60,
+    })
+    limiter = ProviderLimiter('test')
+    keys = [limiter._key(name) for name in ('bucket', 'slots', 'limit')]
+    redis.delete(*keys)
+    yield limiter
+    redis.delete(*keys)
+
+
+def current_limit(limiter) -> float:
+    return float(limiter.redis.get(limiter._key('limit')))
+
+
+def test_token_bucket_allows_burst_then_waits(limiter):
+    assert [limiter.token_wait() for _ in range(3)] == [0, 0, 0]
+    # Токен пополняется за 1 / rate секунд
+    assert 0 < limiter.token_wait() <= 0.1
+
+
+def test_token_bucket_refills_over_time(limiter):
+    for _ in range(3):
+        limiter.token_wait()
+    time.sleep(0.15)
+    assert limiter.token_wait() == 0
+
+
+def test_slots_limited_by_max_concurrency(limiter):
+    assert limiter.try_acquire_slot('a')
+    assert limiter.try_acquire_slot('b')
+    assert not limiter.try_acquire_slot('c')
+    limiter.release_slot('a')
+    assert limiter.try_acquire_slot('c')
+
+
+def test_stale_slots_expire(limiter):
+    limiter.config = {**limiter.config, 'slot_timeout': 0.1}
+    assert limiter.try_acquire_slot('a') and limiter.try_acquire_slot('b')
+    time.sleep(0.15)
+    # Слоты упавших воркеров освобождаются по истечении slot_timeout
+    assert limiter.try_acquire_slot('c')
+
+
+def test_aimd_halves_limit_on_overload_down_to_minimum(limiter):
+    limiter.config = {**limiter.config, 'max_concurrency': 8}
+    limits = []
+    for status_code in (429, 503, 429, 429):
+        limiter.record(status_code)
+        limits.append(current_limit(limiter))
+    assert limits == [4, 2, 1, 1]
+
+
+def test_aimd_grows_limit_additively_up_to_maximum(limiter):
+    limiter.record(429)
+    assert current_limit(limiter) == 1
+    limiter.record(200)
+    assert current_limit(limiter) == 2
+    limiter.record(200)
+    assert current_limit(limiter) == 2  # не больше max_concurrency
+
+
+def test_aimd_ignores_client_errors(limiter):
+    limiter.record(429)
+    limiter.record(404)
+    limiter.record(None)
+    assert current_limit(limiter) == 1
+
+
+def test_decreased_limit_restricts_slots(limiter):
+    limiter.record(503)
+    assert limiter.try_acquire_slot('a')
+    assert not limiter.try_acquire_slot('b')
+
+
+@pytest.mark.parametrize('value, expected', [('120', 120), ('-5', 0), ('soon', None), (None, None)])
+def test_retry_after_seconds(value, expected):
+    response = FakeResponse(429, {'Retry-After': value} if value is not None else {})
+    assert retry_after_seconds(response) == expected
+
+
+def test_retry_after_http_date():
+    response = FakeResponse(503, {'Retry-After': formatdate(time.time() + 30, usegmt=True)})
+    assert 25 < retry_after_seconds(response) <= 30
+
+
+def test_backoff_delay_is_capped():
+    assert backoff_delay(30) <= PROVIDER_MAX_RETRY_AFTER
+    assert backoff_delay(0, FakeResponse(429, {'Retry-After': '2'})) == 2
+
+
+@pytest.fixture
+def no_limits(monkeypatch):
+    """Без Redis: только повторы provider_call, паузы не выполняются"""
+    monkeypatch.setattr(ratelimit, '_redis', lambda: None)
+    monkeypatch.setattr(ratelimit, '_limiters', {})
+    sleeps = []
+    monkeypatch.setattr(ratelimit, 'time', SimpleNamespace(
+        sleep=sleeps.append, time=time.time, perf_counter=time.perf_counter))
+    return sleeps
+
+
+def test_provider_call_retries_overload(no_limits):
+    responses = iter([FakeResponse(429, {'Retry-After': '1'}), FakeResponse(503), FakeResponse(200)])
+    assert provider_call('ocr', lambda: next(responses), max_retries=2).status_code == 200
+    assert len(no_limits) == 2 and no_limits[0] == 1
+
+
+def test_provider_call_raises_after_retries(no_limits):
+    with pytest.raises(RateLimitedError):
+        provider_call('ocr', lambda: FakeResponse(429, {'Retry-After': '0'}), max_retries=2)
+    assert len(no_limits) == 2
+
+
+def test_provider_call_does_not_wait_for_long_retry_after(no_limits):
+    too_long = str(int(PROVIDER_MAX_RETRY_AFTER) + 60)
+    with pytest.raises(RateLimitedError):
+        provider_call('ocr', lambda: FakeResponse(429, {'Retry-After': too_long}))
+    assert no_limits == []
@@ -0,0 +1,85 @@
+import pytest
+
+from django.db import connection
+
+from documents import utils
+from documents.models import Document, TextBlock
+from documents.regions import find_blocks_in_region
+from documents.utils import save_pages
+
+pytestmark = pytest.mark.django_db
+
+# Штамп в правом нижнем углу листов A4 (595 x 842) и A3 (1191 x 842)
+PAGES = [
+    {'number': 1, 'is_scanned': False, 'raw_text': 'a4', 'width': 595.0, 'height': 842.0, 'blocks': [
+        [480.0, 760.0, 590.0, 835.0, 'штамп A4'],
+        [40.0, 40.0, 300.0, 80.0, 'заголовок A4'],
+        [300.0, 700.0, 500.0, 770.0, 'на границе A4'],
+    ]},
+    {'number': 2, 'is_scanned': False, 'raw_text': 'a3', 'width': 1191.0, 'height': 842.0, 'blocks': [
+        [960.0, 760.0, 1185.0, 835.0, 'штамп A3'],
+        [480.0, 760.0, 590.0, 835.0, 'середина A3'],
+    ]},
+    {'number': 3, 'is_scanned': False, 'raw_text': '', 'width': None, 'height': None, 'blocks': [
+        [480.0, 760.0, 590.0, 835.0, 'страница без размера'],
+    ]},
+]
+
+
+@pytest.fixture
+def document(monkeypatch):
+    # Поиск по области работает по строкам TextBlock
+    monkeypatch.setattr(utils, 'TEXT_BLOCK_STORAGE', 'rows')
+    document = Document.objects.create(file='doc.pdf', original_filename='doc.pdf', page_count=len(PAGES))
+    save_pages(document, PAGES)
+    return document
+
+
+def texts(blocks) -> set[str]:
+    return set(blocks.values_list('text', flat=True))
+
+
+def test_absolute_region_intersects(document):
+    assert texts(find_blocks_in_region((470, 750, 595, 842))) == {
+        'штамп A4', 'середина A3', 'страница без размера', 'на границе A4'}
+
+
+def test_absolute_region_within(document):
+    assert texts(find_blocks_in_region((470, 750, 595, 842), mode='within')) == {
+        'штамп A4', 'середина A3', 'страница без размера'}
+
+
+def test_relative_region_follows_page_size(document):
+    # Правая нижняя часть листа любого формата; страницы без размера не участвуют
+    assert texts(find_blocks_in_region((0.8, 0.88, 1, 1), relative=True)) == {'штамп A4', 'штамп A3', 'на границе A4'}
+    assert texts(find_blocks_in_region((0.8, 0.88, 1, 1), relative=True, mode='within')) == {'штамп A4', 'штамп A3'}
+
+
+def test_region_by_document(document):
+    other = Document.objects.create(file='other.pdf', original_filename='other.pdf', page_count=1)
+    save_pages(other, PAGES[:1])
+    assert texts(find_blocks_in_region((0.8, 0.88, 1, 1), relative=True, document_id=other.id,
+                                       mode='within')) == {'штамп A4'}
+
+
+def test_normalized_box_saved_with_block(document):
+    block = TextBlock.objects.get(text='штамп A3')
+    assert (block.nx0, block.ny0, block.nx1, block.ny1) == pytest.approx(
+        (960 / 1191, 760 / 842, 1185 / 1191, 835 / 842))
+    assert TextBlock.objects.get(text='страница без размера').nx0 is None
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        find_blocks_in_region((0, 0, 1, 1), mode='contains')
+
+
+@pytest.mark.parametrize('relative, index', [(False, 'textblock_box_gist'), (True, 'textblock_nbox_gist')])
+def test_region_query_uses_gist_index(document, relative, index):
+    blocks = find_blocks_in_region((0.8, 0.88, 1, 1) if relative else (470, 750, 595, 842), relative=relative)
+    sql, params = blocks.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('SET LOCAL enable_seqscan = off')
+        cursor.execute(f'EXPLAIN {sql}', params)
+        plan = '\n'.join(row[0] for row in cursor.fetchall())
+    assert index in plan
@@ -0,0 +1,70 @@
+import pytest
+
+from documents import tasks
+from documents.utils import iter_pdf_pages, process_pdf, process_pdf_shard, save_pages, split_page_ranges
+
+
+@pytest.mark.parametrize('page_count, shard_size, max_shards, start, expected', [
+    (10, 4, 0, 0, [(0, 4), (4, 8), (8, 10)]),
+    (10, 4, 2, 0, [(0, 5), (5, 10)]),           # не больше max_shards: размер шарда растет
+    (10, 4, 0, 6, [(6, 10)]),                   # продолжение с контрольной точки
+    (10, 0, 0, 3, [(3, 10)]),                   # шардирование отключено
+    (10, 4, 0, 10, []),
+    (0, 4, 0, 0, []),
+])
+def test_split_page_ranges(page_count, shard_size, max_shards, start, expected):
+    assert split_page_ranges(page_count, shard_size, max_shards, start) == expected
+
+
+@pytest.mark.parametrize('page_count, shard_size, max_shards', [(1, 1, 0), (17, 5, 0), (17, 5, 3), (100, 7, 4)])
+def test_split_page_ranges_covers_all_pages_once(page_count, shard_size, max_shards):
+    ranges = split_page_ranges(page_count, shard_size, max_shards)
+    assert [number for start, stop in ranges for number in range(start, stop)] == list(range(page_count))
+    assert max_shards <= 0 or len(ranges) <= max_shards
+
+
+def page_rows(document):
+    return list(document.pages.order_by('number').values_list('number', 'is_scanned', 'raw_text', 'width'))
+
+
+@pytest.mark.django_db
+def test_sharded_parse_matches_serial_parse(make_document, monkeypatch):
+    serial = make_document(7)
+    process_pdf(serial)
+
+    monkeypatch.setattr(tasks, 'PDF_SHARD_SIZE', 3)
+    monkeypatch.setattr(tasks, 'PDF_SHARD_MAX_PARALLEL', 0)
+    sharded = make_document(7)
+    workflow = tasks.parse_document(sharded)
+    assert [(task.args[1], task.args[2]) for task in workflow.tasks] == [(0, 3), (3, 6), (6, 7)]
+    workflow.apply()
+
+    sharded.refresh_from_db()
+    assert sharded.is_parsed and sharded.parsed_pages == 7
+    assert page_rows(sharded) == page_rows(serial)
+
+
+@pytest.mark.django_db
+def test_shard_resumes_after_last_saved_page(make_document):
+    document = make_document(6, page_count=6)
+    # Шард [2, 6) прерван после страниц 3 и 4 (нумерация страниц в модели — с 1)
+    save_pages(document, list(iter_pdf_pages(document.file.path, 2, 4)), checkpoint=False)
+
+    assert process_pdf_shard(document, 2, 6, batch_size=1) == 2
+    # Сохраненные страницы не разбираются и не сохраняются повторно
+    assert list(document.pages.order_by('number').values_list('number', flat=True)) == [3, 4, 5, 6]
+
+
+@pytest.mark.django_db
+def test_finish_checks_all_shards_saved(make_document):
+    document = make_document(6, page_count=6)
+    process_pdf_shard(document, 0, 3)
+    with pytest.raises(RuntimeError):
+        tasks.finish_pdf_shards_task([3], document.id)
+    document.refresh_from_db()
+    assert document.parsed_pages == 0
+
+    process_pdf_shard(document, 3, 6)
+    tasks.finish_pdf_shards_task([3, 3], document.id)
+    document.refresh_from_db()
+    assert document.parsed_pages == 6
@@ -0,0 +1,81 @@
+import hashlib
+import io
+
+import pytest
+
+from rest_framework.test import APIClient
+
+from documents.models import UploadChunk, UploadSession
+from documents.uploads import HashingReader, save_chunk
+
+CHUNK_SIZE = 64 * 1024
+
+
+def sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+@pytest.fixture
+def upload_session(db, media_root):
+    return UploadSession.objects.create(original_filename='big.pdf', total_size=2 * CHUNK_SIZE + 10,
+                                        chunk_size=CHUNK_SIZE)
+
+
+def test_hashing_reader_counts_only_limited_bytes():
+    reader = HashingReader(io.BytesIO(b'abcdef'), limit=4)
+    assert reader.read(3) + reader.read(3) + reader.read() == b'abcd'
+    assert reader.size == 4
+    assert reader.hexdigest() == sha256(b'abcd')
+
+
+def test_chunk_with_matching_hash_is_saved(upload_session):
+    data = b'a' * CHUNK_SIZE
+    chunk = save_chunk(upload_session, 0, io.BytesIO(data), sha256(data).upper())
+    assert (chunk.size, chunk.sha256) == (CHUNK_SIZE, sha256(data))
+    with chunk.file.open('rb') as f:
+        assert f.read() == data
+
+
+def test_chunk_with_wrong_hash_is_rejected(upload_session, media_root):
+    data = b'a' * CHUNK_SIZE
+    with pytest.raises(ValueError, match='Контрольная сумма'):
+        save_chunk(upload_session, 0, io.BytesIO(data), sha256(b'other'))
+    assert not UploadChunk.objects.exists()
+    # Файл отклоненной части удален из хранилища
+    assert not any(path.is_file() for path in media_root.rglob('*'))
+
+
+@pytest.mark.parametrize('index, size', [(0, CHUNK_SIZE - 1), (0, CHUNK_SIZE + 1), (2, 11)])
+def test_chunk_with_wrong_size_is_rejected(upload_session, index, size):
+    with pytest.raises(ValueError, match='Размер части'):
+        save_chunk(upload_session, index, io.BytesIO(b'x' * size))
+
+
+def test_resent_chunk_replaces_previous(upload_session):
+    first, second = b'a' * CHUNK_SIZE, b'b' * CHUNK_SIZE
+    save_chunk(upload_session, 0, io.BytesIO(first))
+    chunk = save_chunk(upload_session, 0, io.BytesIO(second), sha256(second))
+    assert UploadChunk.objects.get().sha256 == sha256(second)
+    with chunk.file.open('rb') as f:
+        assert f.read() == second
+
+
+def test_put_chunk_checks_hash_header(upload_session):
+    client = APIClient()
+    url = f'/documents/api/uploads/{upload_session.id}/chunks/2/'
+    data = b'z' * 10
+
+    response = client.generic('PUT', url, data, content_type='application/octet-stream',
+                              HTTP_X_CHUNK_SHA256=sha256(b'other'))
+    assert response.status_code == 400
+
+    response = client.generic('PUT', url, data, content_type='application/octet-stream',
+                              HTTP_X_CHUNK_SHA256=sha256(data))
+    assert response.status_code == 200
+    assert response.data == {'index': 2, 'size': 10, 'sha256': sha256(data)}
+
+
+def test_put_chunk_without_body(upload_session):
+    response = APIClient().generic('PUT', f'/documents/api/uploads/{upload_session.id}/chunks/0/', b'',
+                                   content_type='application/octet-stream')
+    assert response.status_code == 400
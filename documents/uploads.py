@@ -0,0 +1,125 @@
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+
+from documents.models import Document, UploadChunk, UploadSession
+
+# Загрузка по частям: POST создает сессию, PUT с номером части пишет тело запроса прямо
+# в хранилище (без буферизации всего файла в памяти воркера), завершение собирает части
+# в итоговый файл в фоновой задаче и ставит разбор PDF в очередь.
+
+READ_SIZE = 64 * 1024
+
+
+class HashingReader:
+    """Файлоподобная обертка над потоком: считает sha256 и размер прочитанных данных"""
+
+    def __init__(self, stream, limit=None):
+        self.stream = stream
+        self.limit = limit
+        self.size = 0
+        self.hash = hashlib.sha256()
+
+    def read(self, size=-1) -> bytes:
+        if self.limit is not None:
+            remaining = self.limit - self.size
+            size = remaining if size is None or size < 0 else min(size, remaining)
+            if size <= 0:
+                return b''
+        data = self.stream.read(size)
+        self.size += len(data)
+        self.hash.update(data)
+        return data
+
+    def hexdigest(self) -> str:
+        return self.hash.hexdigest()
+
+
+class ChunksReader:
+    """Последовательное чтение частей сессии из хранилища как одного файла"""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.current = None
+
+    def read(self, size=-1) -> bytes:
+        size = READ_SIZE if size is None or size < 0 else size
+        while True:
+            if self.current is None:
+                chunk = next(self.chunks, None)
+                if chunk is None:
+                    return b''
+                self.current = chunk.file.open('rb')
+            data = self.current.read(size)
+            if data:
+                return data
+            self.current.close()
+            self.current = None
+
+
+def save_chunk(session: UploadSession, index: int, stream, expected_sha256: str = '') -> UploadChunk:
+    """Сохранение части index из потока stream; повторная отправка части заменяет прежнюю
+
+    ValueError — неверный номер, размер или контрольная сумма части; IntegrityError — часть не удалось
+    записать из-за параллельного запроса (сохраненный файл части удаляется).
+    """
+    if not 0 <= index < session.chunk_count:
+        raise ValueError(f'Номер части должен быть от 0 до {session.chunk_count - 1}')
+    expected_size = session.expected_chunk_size(index)
+
+    reader = HashingReader(stream, limit=expected_size + 1)
+    name = default_storage.save(f'uploads/chunks/{session.id}/{index:06d}', File(reader))
+    error = None
+    if reader.size != expected_size:
+        error = f'Размер части {index}: ожидалось {expected_size} байт, получено {reader.size}'
+    elif expected_sha256 and expected_sha256.lower() != reader.hexdigest():
+        error = f'Контрольная сумма части {index} не совпадает'
+    if error:
+        default_storage.delete(name)
+        raise ValueError(error)
+
+    fields = {'file': name, 'size': reader.size, 'sha256': reader.hexdigest()}
+    try:
+        with transaction.atomic():
+            chunk, created = UploadChunk.objects.select_for_update().get_or_create(
+                session=session, index=index, defaults=fields)
+            if not created:
+                old_name = chunk.file.name
+                for field, value in fields.items():
+                    setattr(chunk, field, value)
+                chunk.save(update_fields=list(fields))
+                transaction.on_commit(lambda: default_storage.delete(old_name))
+    except IntegrityError:
+        default_storage.delete(name)
+        raise
+    return chunk
+
+
+def missing_chunks(session: UploadSession) -> list[int]:
+    received = set(session.chunks.values_list('index', flat=True))
+    return [index for index in range(session.chunk_count) if index not in received]
+
+
+def assemble_upload(session: UploadSession) -> Document:
+    """Сборка частей в итоговый файл с подсчетом sha256 содержимого за тот же проход"""
+    chunks = list(session.chunks.order_by('index'))
+    reader = HashingReader(ChunksReader(chunks))
+    filename = os.path.basename(session.original_filename) or f'{session.id}.pdf'
+    name = default_storage.save(f'documents/{filename}', File(reader))
+    if reader.size != session.total_size:
+        default_storage.delete(name)
+        raise ValueError(f'Размер собранного файла {reader.size} байт, ожидалось {session.total_size}')
+
+    with transaction.atomic():
+        document = Document.objects.create(file=name, original_filename=name, content_hash=reader.hexdigest())
+        session.document = document
+        session.status = UploadSession.STATUS_COMPLETE
+        session.save(update_fields=['document', 'status'])
+        session.chunks.all().delete()
+
+    for chunk in chunks:
+        default_storage.delete(chunk.file.name)
+    return document
@@ -1,31 +1,49 @@
+import asyncio
 import fitz
+import hashlib
+import httpx
 import requests
 
-from django.core.cache import cache
-from typing import Optional
-
-from documents.conf import LLM_API_URL, LLM_API_KEY
-from documents.models import Document, Page, TextBlock
-
-
-def is_scanned_page(page_obj) -> bool:
+from asgiref.sync import async_to_sync, sync_to_async
+from django.db import transaction
+from django.db.models import F, Max
+from django.utils import timezone
+from itertools import islice
+from typing import Iterable, Iterator, Optional
+
+from documents import llm_cache, metrics, scoring
+from documents.bulk_load import copy_insert
+from documents.classifier import classify_page_locally
+from documents.conf import (
+    LLM_API_URL, LLM_API_KEY, LLM_CONCURRENCY, LLM_MODEL, LLM_SAVE_BATCH_SIZE, LOCAL_CLASSIFIER_THRESHOLD,
+    PDF_BATCH_SIZE, TEXT_BLOCK_STORAGE)
+from documents.features import PageFeatures
+from documents.llm import validate_materials
+from documents.models import Document, Page, TextBlock, Material
+from documents.packed_blocks import pack_blocks
+from documents.pipeline import is_pipeline_finished, is_pipeline_running
+from documents.progress import publish_pages
+from documents.ratelimit import provider_call
+from documents.scoring import score_text, score_texts
+from documents.search import update_search_vectors
+
+# Версия шаблона промпта для вердикта «скан/текст» (входит в ключ кэша)
+SCAN_PROMPT_VERSION = '1'
+
+
+def is_scanned_page(page_obj, features: Optional[PageFeatures] = None) -> bool:
     """Проверка, является ли страница сканом с использованием комбинированного подхода"""
-    # Быстрые проверки
-    raw_text = page_obj.get_text().strip()
+    # Все признаки страницы извлекаются за один проход
+    features = features or PageFeatures.from_page(page_obj)
+    raw_text = features.raw_text
 
     # 1. Проверка на пустую страницу
     if not raw_text:
         return True
 
     # 2. Проверка структуры документа
-    dict_blocks = page_obj.get_text("dict")["blocks"]
-    text_blocks = [b for b in dict_blocks if b["type"] == 0 and b.get("text", "").strip()]
-    image_blocks = [b for b in dict_blocks if b["type"] == 1]
-
     # Если есть изображения, покрывающие большую часть страницы
-    image_area = sum((b["bbox"][2] - b["bbox"][0]) * (b["bbox"][3] - b["bbox"][1]) for b in image_blocks)
-    page_area = page_obj.rect.width * page_obj.rect.height
-    if page_area > 0 and image_area / page_area > 0.7:
+    if features.image_coverage > 0.7:
         return True
 
     # 3. Анализ качества текста
@@ -33,51 +51,32 @@ def is_scanned_page(page_obj) -> bool:
         return True
 
     # 4. Использование LLM для сложных случаев
-    return check_with_llm_if_needed(page_obj, raw_text)
+    return check_with_llm_if_needed(page_obj, raw_text, features)
 
 
 def looks_like_ocr_artifacts(text: str) -> bool:
     """Проверка текста на типичные артефакты OCR"""
-    # Проверка на неправильные пробелы внутри слов
-    words = text.split()
-    if any(' ' in word and len(word) < 10 for word in words):
-        return True
-
-    # Проверка на странные комбинации символов
-    common_ocr_errors = ['|', '\\', '/', '[', ']']
-    if any(c in text for c in common_ocr_errors):
-        return True
-
-    # Проверка соотношения букв и цифр (в сканах часто путают)
-    letters = sum(c.isalpha() for c in text)
-    digits = sum(c.isdigit() for c in text)
-    if digits > 0 and letters > 0 and digits / letters > 0.5:
-        return True
-
-    # Проверка на повторяющиеся ошибки
-    if count_ocr_errors(text) > len(text.split()) // 10:
-        return True
-
-    return False
+    return score_text(text).looks_like_ocr_artifacts
 
 
 def count_ocr_errors(text: str) -> int:
     """Подсчет потенциальных ошибок OCR"""
-    error_patterns = [
-        'vv', 'nn', 'rr', 'qq',  # Частые замены букв
-        '1i', 'l1', '0o', 'o0',  # Путаница цифр и букв
-        ',,', '..', ';;'  # Дублированные знаки
-    ]
-    return sum(text.count(pattern) for pattern in error_patterns)
+    return scoring.count_ocr_errors(text)
 
 
-def check_with_llm_if_needed(page_obj, raw_text: str) -> bool:
+def check_with_llm_if_needed(page_obj, raw_text: str, features: Optional[PageFeatures] = None) -> bool:
     """Использование LLM для сложных случаев"""
-    # Используем кэш для одинаковых текстов
-    cache_key = f"scan_verdict_{hash(raw_text)}"
-    if cached := cache.get(cache_key):
-        return cached
+    # Используем общий кэш для одинаковых текстов (ключ — по тексту, отправляемому в LLM)
+    verdict = llm_cache.cached_call(
+        'scan', LLM_MODEL, SCAN_PROMPT_VERSION, raw_text[:2000], lambda: request_scan_verdict(raw_text))
+    if verdict is None:
+        # Fallback на эвристику при ошибке
+        return default_heuristic_check(page_obj, raw_text, features)
+    return verdict
 
+
+def request_scan_verdict(raw_text: str) -> Optional[bool]:
+    """Вердикт LLM: True — скан, False — текст PDF, None — ошибка вызова"""
     # Отправляем только первые 2000 символов для экономии токенов
     prompt = f"""Анализ документа. Это:
     1) Прямой текст из PDF - ответ 'text'
@@ -90,21 +89,19 @@ def check_with_llm_if_needed(page_obj, raw_text: str) -> bool:
     Текст: {raw_text[:2000]}"""
 
     try:
-        response = requests.post(
+        # Без повторов: при ошибке сразу используется эвристика
+        response = provider_call('llm', lambda: requests.post(
             LLM_API_URL,
             headers={"Authorization": f"Bearer {LLM_API_KEY}"},
-            json={"model": "deepseek-chat", "messages": [{"role": "user", "content": prompt}]},
+            json={"model": LLM_MODEL, "messages": [{"role": "user", "content": prompt}]},
             timeout=5
-        )
-        verdict = "scan" in response.json()["choices"][0]["message"]["content"].lower()
-        cache.set(cache_key, verdict, timeout=3600)
-        return verdict
+        ), max_retries=0)
+        return "scan" in response.json()["choices"][0]["message"]["content"].lower()
     except Exception:
-        # Fallback на эвристику при ошибке
-        return default_heuristic_check(page_obj, raw_text)
+        return None
 
 
-def default_heuristic_check(page_obj, raw_text: str) -> bool:
+def default_heuristic_check(page_obj, raw_text: str, features: Optional[PageFeatures] = None) -> bool:
     """Эвристическая проверка когда LLM недоступен"""
     word_count = len(raw_text.split())
     avg_word_len = sum(len(word) for word in raw_text.split()) / word_count if word_count else 0
@@ -114,70 +111,334 @@ def default_heuristic_check(page_obj, raw_text: str) -> bool:
         return True
 
     # Проверка площади текста
-    dict_blocks = page_obj.get_text("dict")["blocks"]
-    text_blocks = [b for b in dict_blocks if b["type"] == 0 and b.get("text", "").strip()]
-    text_area = sum((b["bbox"][2] - b["bbox"][0]) * (b["bbox"][3] - b["bbox"][1]) for b in text_blocks)
-    page_area = page_obj.rect.width * page_obj.rect.height
-    if page_area > 0 and text_area / page_area < 0.05:
+    features = features or PageFeatures.from_page(page_obj)
+    if features.page_area > 0 and features.text_coverage < 0.05:
         return True
 
     return False
 
 
-def process_pdf(document: Document):
-    """Обработка PDF документа и создание страниц"""
-    doc_path = document.file.path
-    pdf = fitz.open(doc_path)
+def extract_page_data(page_obj, page_number: int) -> dict:
+    """Извлечение данных одной страницы в сериализуемом виде (для шардов Celery)"""
+    with metrics.timer('docscope_stage_seconds', stage='pdf_extract'):
+        features = PageFeatures.from_page(page_obj)
+    with metrics.timer('docscope_stage_seconds', stage='scan_check'):
+        is_scanned = is_scanned_page(page_obj, features)
+    return {
+        'number': page_number + 1,
+        'is_scanned': is_scanned,
+        'raw_text': features.raw_text,
+        'width': features.width,
+        'height': features.height,
+        'blocks': features.blocks,
+    }
+
+
+def iter_pdf_pages(doc_path: str, start: int = 0, stop: Optional[int] = None) -> Iterator[dict]:
+    """Потоковое извлечение страниц PDF из диапазона [start, stop) (нумерация с 0)"""
+    with fitz.open(doc_path) as pdf:
+        stop = len(pdf) if stop is None else min(stop, len(pdf))
+        for page_number in range(start, stop):
+            yield extract_page_data(pdf[page_number], page_number)
+
+
+def split_page_ranges(page_count: int, shard_size: int, max_shards: int, start: int = 0) -> list[tuple[int, int]]:
+    """Разбиение страниц [start, page_count) на диапазоны, не больше чем на max_shards шардов"""
+    remaining = page_count - start
+    if remaining <= 0:
+        return []
+    if shard_size <= 0:
+        return [(start, page_count)]
+    if max_shards > 0:
+        shard_size = max(shard_size, -(-remaining // max_shards))
+    return [(first, min(first + shard_size, page_count)) for first in range(start, page_count, shard_size)]
+
+
+def iter_batches(items: Iterable, size: int) -> Iterator[list]:
+    """Разбиение последовательности на пачки по size элементов (size <= 0 — одна пачка)"""
+    items = iter(items)
+    while batch := list(islice(items, size) if size > 0 else items):
+        yield batch
+
+
+def normalized_box(x0: float, y0: float, x1: float, y1: float, width: Optional[float], height: Optional[float]) -> dict:
+    """Координаты блока в долях размера страницы (поля nx0..ny1 TextBlock); без размера страницы — пусто"""
+    if not width or not height:
+        return {}
+    return {'nx0': x0 / width, 'ny0': y0 / height, 'nx1': x1 / width, 'ny1': y1 / height}
+
+
+def save_pages(document: Document, pages_data: list[dict], checkpoint: bool = True):
+    """Сохранение пачки страниц и текстовых блоков в одной транзакции с отметкой прогресса
+
+    checkpoint=False — без отметки parsed_pages (шарды сохраняют страницы не по порядку документа).
+    """
+    # Страницы, уже сохраненные до перезапуска задачи, пропускаются
+    pages_data = sorted(
+        (data for data in pages_data if data['number'] > document.parsed_pages),
+        key=lambda data: data['number']
+    )
+    if not pages_data:
+        return
+
+    pages_to_create = [
+        Page(
+            document=document,
+            number=data['number'],
+            is_scanned=data['is_scanned'],
+            raw_text=data['raw_text'],
+            width=data['width'],
+            height=data['height'],
+            packed_blocks=pack_blocks(data['blocks']) if TEXT_BLOCK_STORAGE != 'rows' else None,
+        )
+        for data in pages_data
+    ]
 
-    # Создаем все страницы одним запросом
-    pages_to_create = []
-    text_blocks_to_create = []
+    with metrics.timer('docscope_stage_seconds', stage='db_write'), transaction.atomic():
+        # Массовое создание страниц через COPY (id резервируются заранее и проставляются объектам)
+        created_pages = copy_insert(Page, pages_to_create)
+
+        # Текстовые блоки ссылаются на уже сохраненную страницу (в режиме packed блоки только в packed_blocks)
+        if TEXT_BLOCK_STORAGE != 'packed':
+            text_blocks_to_create = [
+                TextBlock(page=page, x0=x0, y0=y0, x1=x1, y1=y1, text=text,
+                          **normalized_box(x0, y0, x1, y1, data['width'], data['height']))
+                for page, data in zip(created_pages, pages_data)
+                for x0, y0, x1, y1, text in data['blocks']
+            ]
 
-    for page_number in range(len(pdf)):
-        page_obj = pdf[page_number]
-        raw_text = page_obj.get_text().strip()
-        is_scanned = is_scanned_page(page_obj)
+            # Массовое создание текстовых блоков (id блоков не нужны — их назначает СУБД)
+            copy_insert(TextBlock, text_blocks_to_create, set_pks=False)
 
-        page = Page(
-            document=document,
-            number=page_number + 1,
-            is_scanned=is_scanned,
-            raw_text=raw_text,
-            width=page_obj.rect.width,
-            height=page_obj.rect.height
-        )
-        pages_to_create.append(page)
-
-        # Собираем текстовые блоки
-        for block in page_obj.get_text("blocks"):
-            x0, y0, x1, y1, text, *_ = block
-            if text.strip():
-                text_blocks_to_create.append(TextBlock(
-                    page=page,  # Ссылка будет установлена после сохранения
-                    x0=x0,
-                    y0=y0,
-                    x1=x1,
-                    y1=y1,
-                    text=text.strip()
-                ))
-
-    # Массовое создание страниц
-    created_pages = Page.objects.bulk_create(pages_to_create)
-
-    # Устанавливаем связи для текстовых блоков
-    for block, page in zip(text_blocks_to_create, created_pages):
-        block.page = page
-
-    # Массовое создание текстовых блоков
-    TextBlock.objects.bulk_create(text_blocks_to_create)
-
-
-def process_document_pages(document, processor, saver, description: Optional[str] = None):
-    """Обработка страниц документа с помощью переданных функций"""
-    for page in document.pages.all().order_by('number'):
+        # Поисковый индекс пачки страниц — одним UPDATE в той же транзакции
+        update_search_vectors(Page.objects.filter(id__in=[page.id for page in created_pages]))
+
+        # Контрольная точка: последняя сохраненная страница
+        if checkpoint:
+            document.parsed_pages = pages_data[-1]['number']
+            Document.objects.filter(id=document.id).update(parsed_pages=document.parsed_pages)
+    metrics.inc('docscope_pages_total', len(pages_data), stage='parse')
+    publish_pages(document.id, 'parse', [data['number'] for data in pages_data],
+                  parsed_pages=document.parsed_pages, page_count=document.page_count)
+
+
+def set_page_count(document: Document, page_count: int):
+    """Сохранение общего числа страниц документа"""
+    if document.page_count != page_count:
+        document.page_count = page_count
+        Document.objects.filter(id=document.id).update(page_count=page_count)
+
+
+def process_pdf(document: Document, batch_size: int = PDF_BATCH_SIZE):
+    """Обработка PDF документа и создание страниц пачками по batch_size
+
+    Разбор продолжается со страницы, следующей за document.parsed_pages, поэтому
+    повторный запуск после падения не повторяет уже сохраненную работу.
+    """
+    with fitz.open(document.file.path) as pdf:
+        set_page_count(document, len(pdf))
+
+    pages = iter_pdf_pages(document.file.path, start=document.parsed_pages)
+    for batch in iter_batches(pages, batch_size):
+        save_pages(document, batch)
+        # Сбрасываем кэш MuPDF, чтобы память процесса не росла с числом страниц
+        fitz.TOOLS.store_shrink(100)
+
+
+def process_pdf_shard(document: Document, start: int, stop: int, batch_size: int = PDF_BATCH_SIZE) -> int:
+    """Разбор и сохранение страниц шарда [start, stop) (нумерация с 0); результат — число сохраненных страниц
+
+    Контрольная точка документа не меняется: ее отмечает завершение всех шардов. Пачки шарда
+    сохраняются по порядку, поэтому повторный запуск продолжает разбор за последней сохраненной страницей.
+    """
+    saved = document.pages.filter(number__gt=start, number__lte=stop).aggregate(last=Max('number'))['last']
+    pages = iter_pdf_pages(document.file.path, start=saved or start, stop=stop)
+    count = 0
+    for batch in iter_batches(pages, batch_size):
+        save_pages(document, batch, checkpoint=False)
+        count += len(batch)
+        fitz.TOOLS.store_shrink(100)
+    return count
+
+
+def compute_content_hash(file) -> str:
+    """SHA-256 содержимого загруженного файла, читаемого по частям"""
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def _duplicates(document: Document):
+    return Document.objects.filter(content_hash=document.content_hash).exclude(id=document.id).order_by('id')
+
+
+def find_parsed_duplicate(document: Document) -> Optional[Document]:
+    """Ранее полностью обработанный документ с тем же содержимым
+
+    Подходит только документ с завершенным разбором, все этапы конвейера которого выполнены или пропущены:
+    у документа в обработке еще нет OCR, классификации или материалов, и копия осталась бы без них.
+    """
+    if not document.content_hash:
+        return None
+    candidates = _duplicates(document).filter(page_count__isnull=False, parsed_pages__gte=F('page_count'))
+    return next((source for source in candidates.iterator() if is_pipeline_finished(source)), None)
+
+
+def has_duplicate_in_progress(document: Document) -> bool:
+    """Загруженный раньше документ с тем же содержимым еще разбирается или обрабатывается конвейером"""
+    if not document.content_hash:
+        return False
+    earlier = _duplicates(document).filter(id__lt=document.id).only('page_count', 'parsed_pages', 'pipeline_status')
+    return any(not source.is_parsed or is_pipeline_running(source) for source in earlier)
+
+
+def _clone_fields(obj, exclude: tuple) -> dict:
+    return {
+        field.attname: getattr(obj, field.attname)
+        for field in obj._meta.concrete_fields
+        if not field.primary_key and field.attname not in exclude
+    }
+
+
+def clone_document_content(source: Document, target: Document, batch_size: int = PDF_BATCH_SIZE):
+    """Копирование страниц, текстовых блоков, классификаций и материалов из документа-дубликата
+
+    Копирование идет пачками страниц с той же контрольной точкой, что и разбор PDF.
+    """
+    set_page_count(target, source.page_count)
+
+    source_pages = source.pages.filter(number__gt=target.parsed_pages).order_by('number')
+    for batch in iter_batches(source_pages.iterator(chunk_size=batch_size), batch_size):
+        with transaction.atomic():
+            cloned_pages = copy_insert(Page, [
+                Page(document=target, **_clone_fields(page, exclude=('document_id', 'created_at')))
+                for page in batch
+            ])
+            page_map = {page.id: clone for page, clone in zip(batch, cloned_pages)}
+
+            copy_insert(TextBlock, (
+                TextBlock(page=page_map[block.page_id], **_clone_fields(block, exclude=('page_id',)))
+                for block in TextBlock.objects.filter(page_id__in=page_map).order_by('id').iterator()
+            ), set_pks=False)
+            copy_insert(Material, (
+                Material(page=page_map[material.page_id], **_clone_fields(material, exclude=('page_id',)))
+                for material in Material.objects.filter(page_id__in=page_map).order_by('id').iterator()
+            ), set_pks=False)
+
+            target.parsed_pages = batch[-1].number
+            Document.objects.filter(id=target.id).update(parsed_pages=target.parsed_pages)
+
+
+def classify_pages_locally(pages: list[Page], threshold: float = LOCAL_CLASSIFIER_THRESHOLD) -> list[Page]:
+    """Локальная классификация страниц (с предзагруженными blocks или packed_blocks)
+
+    Уверенно классифицированные страницы сохраняются, остальные возвращаются для LLM.
+    """
+    classified, uncertain = [], []
+    texts = [page.raw_text or page.ocr_text for page in pages]
+    for page, text, features in zip(pages, texts, score_texts(text[:4000] for text in texts)):
+        label, confidence = classify_page_locally(text, page.get_blocks(), page.width, page.height, features)
+        if label and confidence >= threshold:
+            page.classification = label
+            page.classification_source = Page.SOURCE_LOCAL
+            classified.append(page)
+        else:
+            uncertain.append(page)
+
+    Page.objects.bulk_update(classified, ["classification", "classification_source"])
+    metrics.inc('docscope_pages_total', len(classified), stage='classify_local')
+    numbers = {}
+    for page in classified:
+        numbers.setdefault(page.document_id, []).append(page.number)
+    for document_id, document_numbers in numbers.items():
+        publish_pages(document_id, 'classify', document_numbers)
+    return uncertain
+
+
+def replace_page_materials(results: list[tuple[Page, Optional[list[dict]]]]):
+    """Замена материалов страниц результатами извлечения: удаление старых и массовая вставка в одной транзакции
+
+    Повторный запуск извлечения не дублирует материалы, а перезаписывает их постранично. Страницы
+    отмечаются как обработанные (materials_extracted_at), даже если материалов нет; страницы с ошибкой
+    вызова LLM или некорректным ответом (None) пропускаются и сохраняют прежние материалы.
+    """
+    # Повторная проверка: в кэше могут быть ответы, сохраненные до проверки формата
+    results = [(page, validate_materials(page_materials)) for page, page_materials in results
+               if page_materials is not None]
+    results = [(page, page_materials) for page, page_materials in results if page_materials is not None]
+    if not results:
+        return
+    materials = [
+        Material(page=page, name=mat['name'][:256], characteristics=mat['characteristics'])
+        for page, page_materials in results
+        for mat in page_materials
+    ]
+    page_ids = [page.id for page, _ in results]
+    with transaction.atomic():
+        Material.objects.filter(page_id__in=page_ids).delete()
+        Material.objects.bulk_create(materials)
+        Page.objects.filter(id__in=page_ids).update(materials_extracted_at=timezone.now())
+
+
+def process_document_pages(document, processor, saver, description: Optional[str] = None, pages=None):
+    """Обработка страниц документа (или переданного набора страниц pages) с помощью переданных функций"""
+    pages = document.pages.all() if pages is None else pages
+    for page in pages.order_by('number'):
         text = page.raw_text or page.ocr_text
         if not text:
             continue
 
-        result = processor(text)
+        with metrics.timer('docscope_stage_seconds', stage=description or 'pages'):
+            result = processor(text)
         saver(page, result)
+        metrics.inc('docscope_pages_total', stage=description or 'pages')
+        publish_pages(page.document_id, description or 'pages', [page.number])
+
+
+def process_document_pages_async(document, processor, bulk_saver, description: Optional[str] = None,
+                                 concurrency: int = LLM_CONCURRENCY, batch_size: int = LLM_SAVE_BATCH_SIZE,
+                                 pages=None):
+    """Конкурентная обработка страниц документа через общий пул HTTP-соединений
+
+    processor — корутина processor(client, text), bulk_saver получает список пар (page, result),
+    упорядоченный по номеру страницы, и сохраняет их одним запросом.
+    """
+    pages = document.pages.all() if pages is None else pages
+    pages_with_text = []
+    for page in pages.order_by('number'):
+        text = page.raw_text or page.ocr_text
+        if text:
+            pages_with_text.append((page, text))
+
+    def save(results):
+        bulk_saver(results)
+        publish_pages(document.id, description or 'pages', [page.number for page, _ in results])
+
+    async_to_sync(_aprocess_pages)(
+        pages_with_text, processor, save, concurrency, batch_size, description or 'pages')
+
+
+async def _aprocess_pages(pages, processor, bulk_saver, concurrency: int, batch_size: int, stage: str):
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    save = sync_to_async(bulk_saver)
+
+    async with httpx.AsyncClient(limits=limits) as client:
+        async def run(page, text):
+            async with semaphore:
+                with metrics.timer('docscope_stage_seconds', stage=stage):
+                    result = await processor(client, text)
+                metrics.inc('docscope_pages_total', stage=stage)
+                return page, result
+
+        # Результаты сохраняются пачками по мере готовности, внутри пачки — в порядке страниц
+        batch = []
+        for future in asyncio.as_completed([run(page, text) for page, text in pages]):
+            batch.append(await future)
+            if len(batch) >= batch_size:
+                await save(sorted(batch, key=lambda item: item[0].number))
+                batch = []
+        if batch:
+            await save(sorted(batch, key=lambda item: item[0].number))